@@ -1,19 +1,20 @@
 from fastapi import APIRouter, HTTPException, Request, Response, Cookie, UploadFile, File
 from fastapi.responses import RedirectResponse
 import asyncio
-import json
 import logging
 import os
 import sys
 import tempfile
 import math
+import orjson
 import time
 import uuid
 import spotipy
+from pathlib import Path
 from typing import List, Optional
 
 from auth.oauth_handler import (
-    SpotifyOAuthHandler, store_user_token, revoke_user_token, get_spotify_client,
+    get_oauth_handler, store_user_token, revoke_user_token, get_spotify_client,
     pick_app_index, assign_user_to_app, remove_user_from_app,
 )
 from spotipy.oauth2 import SpotifyOAuth
@@ -30,6 +31,8 @@ _ingestion_semaphore = asyncio.Semaphore(1)
 # Number of GCS files to download and ingest per batch. Each batch gets a fresh
 # SpotifyParser (empty caches) and BigQuery buffer, bounding peak RAM to
 # ~150–250 MB per batch instead of growing proportionally with total file count.
+# That estimate assumes the default INGEST_FLUSH_EVERY_EVENTS (10k events, so
+# ~20k buffered while a flush is in flight); raising it raises the peak.
 _FILE_BATCH_SIZE = 5
 
 
@@ -122,7 +125,7 @@ async def get_auth_url():
     """Returns the Spotify authorization URL for the frontend to redirect to."""
     try:
         app_index = pick_app_index()
-        handler = SpotifyOAuthHandler(app_index=app_index)
+        handler = get_oauth_handler(app_index)
         sp_oauth = SpotifyOAuth(
             client_id=handler.client_id,
             client_secret=handler.client_secret,
@@ -145,7 +148,7 @@ async def login():
     """Redirects the user to Spotify for authentication."""
     try:
         app_index = pick_app_index()
-        handler = SpotifyOAuthHandler(app_index=app_index)
+        handler = get_oauth_handler(app_index)
         sp_oauth = SpotifyOAuth(
             client_id=handler.client_id,
             client_secret=handler.client_secret,
@@ -179,20 +182,14 @@ async def callback(request: Request):
         except (ValueError, IndexError):
             app_index = 0
 
-        handler = SpotifyOAuthHandler(app_index=app_index)
+        handler = get_oauth_handler(app_index)
 
-        # Use a temp cache path unique to this request so concurrent logins
-        # don't overwrite each other. We'll move the token to the per-user
-        # path once we know the user_id.
-        from spotipy.cache_handler import CacheFileHandler
-        tmp_cache = f".spotify_cache_tmp_{uuid.uuid4().hex}"
-        try:
-            sp_oauth = handler.build_oauth(CacheFileHandler(cache_path=tmp_cache), show_dialog=True)
-            token_info = sp_oauth.get_access_token(code)
-        finally:
-            # Always clean up the temp file regardless of outcome
-            if os.path.exists(tmp_cache):
-                os.remove(tmp_cache)
+        # Hold the exchanged token in a per-request memory cache so concurrent
+        # logins don't overwrite each other and nothing touches disk. The token
+        # is persisted to the per-user cache once we know the user_id.
+        from spotipy.cache_handler import MemoryCacheHandler
+        sp_oauth = handler.build_oauth(MemoryCacheHandler(), show_dialog=True)
+        token_info = sp_oauth.get_access_token(code)
 
         # Identify the user from their access token
         sp = spotipy.Spotify(auth=token_info['access_token'])
@@ -373,15 +370,17 @@ def _validate_and_combine(temp_paths: List[str], combined_path: str) -> int:
     import ijson
 
     total = 0
-    with open(combined_path, "w", encoding="utf-8") as out:
-        out.write("[")
+    # 1 MB write buffer: the output is hundreds of thousands of tiny writes.
+    with open(combined_path, "wb", buffering=1024 * 1024) as out:
+        out.write(b"[")
         first_event = True
 
         for tp in temp_paths:
             with open(tp, "rb") as f:
                 # Peek at the first object to validate format before streaming the rest
                 try:
-                    parser = ijson.items(f, "item")
+                    # use_float: ijson's default Decimal values aren't JSON-serialisable
+                    parser = ijson.items(f, "item", use_float=True)
                     first = next(parser, None)
                 except Exception:
                     raise HTTPException(status_code=400, detail="One of the uploaded files contains invalid JSON.")
@@ -399,17 +398,17 @@ def _validate_and_combine(temp_paths: List[str], combined_path: str) -> int:
 
                 # Write first item, then stream the rest one object at a time
                 if not first_event:
-                    out.write(",")
-                out.write(json.dumps(first))
+                    out.write(b",")
+                out.write(orjson.dumps(first))
                 first_event = False
                 total += 1
 
+                dumps = orjson.dumps
                 for item in parser:
-                    out.write(",")
-                    out.write(json.dumps(item))
+                    out.write(b"," + dumps(item))
                     total += 1
 
-        out.write("]")
+        out.write(b"]")
 
     return total
 
@@ -451,8 +450,7 @@ async def _run_ingestion_task(job_id: str, combined_path: str, user_id: str):
         created_at = upload_jobs[job_id].get("created_at")
         upload_jobs[job_id] = {"status": "error", "progress": 0, "message": str(e), "user_id": user_id, "created_at": created_at}
         try:
-            if os.path.exists(combined_path):
-                os.remove(combined_path)
+            Path(combined_path).unlink(missing_ok=True)
         except OSError:
             pass
 
@@ -540,18 +538,18 @@ async def _run_gcs_ingestion_task(job_id: str, gcs_paths: List[str], user_id: st
     _active_combined: List[str] = []  # one-element list for mutability in nested scope
 
     def _cleanup():
+        # unlink() without missing_ok: a missing file raises (swallowed below),
+        # so the log line only records files that were actually removed.
         for tp in _active_temp_paths:
             try:
-                if os.path.exists(tp):
-                    os.remove(tp)
-                    logger.info("[gcs-ingest][job=%s] Cleaned up temp file: %s", job_id, tp)
+                Path(tp).unlink()
+                logger.info("[gcs-ingest][job=%s] Cleaned up temp file: %s", job_id, tp)
             except OSError:
                 pass
         if _active_combined:
             try:
-                if os.path.exists(_active_combined[0]):
-                    os.remove(_active_combined[0])
-                    logger.info("[gcs-ingest][job=%s] Cleaned up combined file: %s", job_id, _active_combined[0])
+                Path(_active_combined[0]).unlink()
+                logger.info("[gcs-ingest][job=%s] Cleaned up combined file: %s", job_id, _active_combined[0])
             except OSError:
                 pass
 
@@ -576,18 +574,28 @@ async def _run_gcs_ingestion_task(job_id: str, gcs_paths: List[str], user_id: st
                 "user_id": user_id,
                 "created_at": upload_jobs[job_id].get("created_at"),
             }
-            batch_temp_paths = []
-            for gcs_path in batch_gcs_paths:
-                temp_path = os.path.join(
-                    tempfile.gettempdir(), f"spotify_gcs_{user_id}_{uuid.uuid4().hex}.json"
-                )
-                _active_temp_paths.append(temp_path)
+            def _download(gcs_path: str, temp_path: str):
                 t_dl = time.monotonic()
                 bucket.blob(gcs_path).download_to_filename(temp_path)
                 size_mb = os.path.getsize(temp_path) / 1_048_576
                 logger.info("[gcs-ingest][job=%s] Downloaded gs://%s/%s → %s (%.2f MB, %.1fs)",
                             job_id, _GCS_BUCKET, gcs_path, temp_path, size_mb, time.monotonic() - t_dl)
-                batch_temp_paths.append(temp_path)
+
+            batch_temp_paths = [
+                os.path.join(tempfile.gettempdir(), f"spotify_gcs_{user_id}_{uuid.uuid4().hex}.json")
+                for _ in batch_gcs_paths
+            ]
+            _active_temp_paths.extend(batch_temp_paths)
+            # Blobs are independent — download them concurrently off the event loop.
+            # Every download is awaited before a failure is raised, so _cleanup()
+            # never runs while a sibling thread is still writing its temp file.
+            results = await asyncio.gather(*(
+                asyncio.to_thread(_download, gcs_path, temp_path)
+                for gcs_path, temp_path in zip(batch_gcs_paths, batch_temp_paths)
+            ), return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
 
             # --- validate + combine ---
             upload_jobs[job_id]["message"] = f"Validating files (batch {batch_label})..."
@@ -606,9 +614,8 @@ async def _run_gcs_ingestion_task(job_id: str, gcs_paths: List[str], user_id: st
             # Delete downloaded temp files — combined file takes over
             for tp in batch_temp_paths:
                 try:
-                    if os.path.exists(tp):
-                        os.remove(tp)
-                        _active_temp_paths.remove(tp)
+                    Path(tp).unlink(missing_ok=True)
+                    _active_temp_paths.remove(tp)
                 except OSError:
                     pass
 
@@ -738,13 +745,11 @@ async def upload_history(
     def _cleanup():
         for _, tp in assigned:
             try:
-                if os.path.exists(tp):
-                    os.remove(tp)
+                Path(tp).unlink(missing_ok=True)
             except OSError:
                 pass
         try:
-            if os.path.exists(combined_path):
-                os.remove(combined_path)
+            Path(combined_path).unlink(missing_ok=True)
         except OSError:
             pass
 
@@ -764,8 +769,7 @@ async def upload_history(
         # Individual temp files are no longer needed — combined file takes over
         for _, tp in assigned:
             try:
-                if os.path.exists(tp):
-                    os.remove(tp)
+                Path(tp).unlink(missing_ok=True)
             except OSError:
                 pass
 
@@ -1,6 +1,7 @@
 from .oauth_handler import (
     get_spotify_client,
     SpotifyOAuthHandler,
+    get_oauth_handler,
     store_user_token,
     revoke_user_token,
     current_user_id,
@@ -9,6 +10,7 @@ from .oauth_handler import (
 __all__ = [
     'get_spotify_client',
     'SpotifyOAuthHandler',
+    'get_oauth_handler',
     'store_user_token',
     'revoke_user_token',
     'current_user_id',
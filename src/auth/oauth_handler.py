@@ -1,18 +1,31 @@
 import json
 import logging
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextvars import ContextVar
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, FrozenSet, Optional, Tuple
 
 from spotipy import Spotify
 from spotipy.cache_handler import CacheHandler, CacheFileHandler
-from spotipy.oauth2 import SpotifyOAuth
+from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
 from dotenv import load_dotenv
 
 project_root = Path(__file__).parent.parent.parent
 env_path = project_root / '.env'
-load_dotenv(dotenv_path=env_path)
+# Deployments inject credentials directly; only parse .env when they're missing.
+if "SPOTIFY_CLIENT_ID" not in os.environ:
+    load_dotenv(dotenv_path=env_path)
+
+# Credentials are read once at import instead of on every handler instantiation.
+_APP_CREDENTIALS: Tuple[Tuple[Optional[str], Optional[str]], ...] = (
+    (os.environ.get("SPOTIFY_CLIENT_ID"), os.environ.get("SPOTIFY_CLIENT_SECRET")),
+    (os.environ.get("SPOTIFY_CLIENT_ID_1"), os.environ.get("SPOTIFY_CLIENT_SECRET_1")),
+)
+_REDIRECT_URI = os.environ.get("SPOTIFY_REDIRECT_URI", "http://localhost:8888/callback")
 
 logger = logging.getLogger(__name__)
 
@@ -32,22 +45,51 @@ _user_clients: Dict[str, Spotify] = {}
 # Maximum users allowed per Spotify app (Development Mode limit)
 _MAX_USERS_PER_APP = 5
 
+# Tokens expiring within this window are refreshed in the background so callers
+# never wait on Spotify's token endpoint while the current token is still usable.
+_STALE_SECONDS = 300
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="spotify-token-refresh")
+_refresh_futures: Dict[str, Future] = {}
+_refresh_lock = threading.Lock()
+# Last known expires_at per user, so fresh tokens skip the cache read entirely.
+_token_expiry: Dict[str, float] = {}
+
 
 # ---------------------------------------------------------------------------
 # Multi-app credential helpers
 # ---------------------------------------------------------------------------
 
-def get_app_credentials(app_index: int = 0) -> Tuple[str, str]:
-    """Return (client_id, client_secret) for the given Spotify app index."""
-    if app_index == 1:
-        return (
-            os.getenv("SPOTIFY_CLIENT_ID_1"),
-            os.getenv("SPOTIFY_CLIENT_SECRET_1"),
-        )
-    return (
-        os.getenv("SPOTIFY_CLIENT_ID"),
-        os.getenv("SPOTIFY_CLIENT_SECRET"),
-    )
+@lru_cache(maxsize=1)
+def _get_firestore_client():
+    """Return the process-wide Firestore client.
+
+    The client is thread-safe and holds the gRPC channel, so sharing it avoids
+    re-authenticating and reconnecting on every token read or app lookup.
+    """
+    from google.cloud import firestore
+    project_id = os.getenv("FIRESTORE_PROJECT_ID")
+    database_id = os.getenv("FIRESTORE_DATABASE_ID", "tolajs-timber")
+    if project_id:
+        return firestore.Client(project=project_id, database=database_id)
+    return firestore.Client(database=database_id)
+
+
+def _get_app_user_ids() -> Tuple[list, list]:
+    """Return the user_ids assigned to app 0 and app 1, read in one round-trip."""
+    db = _get_firestore_client()
+    refs = [db.collection("spotify_app_users").document(f"app_{idx}") for idx in (0, 1)]
+    user_ids = {
+        doc.id: doc.to_dict().get("user_ids", []) if doc.exists else []
+        for doc in db.get_all(refs)
+    }
+    return user_ids.get("app_0", []), user_ids.get("app_1", [])
+
+def get_app_credentials(app_index: int = 0) -> Tuple[Optional[str], Optional[str]]:
+    """Return (client_id, client_secret) for the given Spotify app index.
+
+    Either value is None when its environment variable is unset.
+    """
+    return _APP_CREDENTIALS[1 if app_index == 1 else 0]
 
 
 def pick_app_index() -> int:
@@ -59,15 +101,9 @@ def pick_app_index() -> int:
     if not os.getenv("FIRESTORE_PROJECT_ID"):
         return 0  # local dev — always use app 0
 
-    from google.cloud import firestore
-    project_id = os.getenv("FIRESTORE_PROJECT_ID")
-    database_id = os.getenv("FIRESTORE_DATABASE_ID", "tolajs-timber")
-    db = firestore.Client(project=project_id, database=database_id)
-
+    app_users = _get_app_user_ids()
     for idx in (0, 1):
-        doc = db.collection("spotify_app_users").document(f"app_{idx}").get()
-        count = len(doc.to_dict().get("user_ids", [])) if doc.exists else 0
-        if count < _MAX_USERS_PER_APP:
+        if len(app_users[idx]) < _MAX_USERS_PER_APP:
             return idx
 
     raise ValueError("All Spotify apps are at capacity.")
@@ -78,14 +114,9 @@ def get_user_app_index(user_id: str) -> int:
     if not os.getenv("FIRESTORE_PROJECT_ID"):
         return 0
 
-    from google.cloud import firestore
-    project_id = os.getenv("FIRESTORE_PROJECT_ID")
-    database_id = os.getenv("FIRESTORE_DATABASE_ID", "tolajs-timber")
-    db = firestore.Client(project=project_id, database=database_id)
-
+    app_users = _get_app_user_ids()
     for idx in (0, 1):
-        doc = db.collection("spotify_app_users").document(f"app_{idx}").get()
-        if doc.exists and user_id in doc.to_dict().get("user_ids", []):
+        if user_id in app_users[idx]:
             return idx
 
     return 0  # not yet assigned — default to app 0
@@ -97,9 +128,7 @@ def assign_user_to_app(user_id: str, app_index: int) -> None:
         return
 
     from google.cloud import firestore
-    project_id = os.getenv("FIRESTORE_PROJECT_ID")
-    database_id = os.getenv("FIRESTORE_DATABASE_ID", "tolajs-timber")
-    db = firestore.Client(project=project_id, database=database_id)
+    db = _get_firestore_client()
 
     ref = db.collection("spotify_app_users").document(f"app_{app_index}")
     ref.set(
@@ -115,16 +144,18 @@ def remove_user_from_app(user_id: str) -> None:
         return
 
     from google.cloud import firestore
-    project_id = os.getenv("FIRESTORE_PROJECT_ID")
-    database_id = os.getenv("FIRESTORE_DATABASE_ID", "tolajs-timber")
-    db = firestore.Client(project=project_id, database=database_id)
+    db = _get_firestore_client()
 
+    # Both app documents are updated in one commit.
+    batch = db.batch()
     for idx in (0, 1):
         ref = db.collection("spotify_app_users").document(f"app_{idx}")
-        ref.set(
+        batch.set(
+            ref,
             {"user_ids": firestore.ArrayRemove([user_id])},
             merge=True,
         )
+    batch.commit()
 
 
 # ---------------------------------------------------------------------------
@@ -136,26 +167,63 @@ class FirestoreCacheHandler(CacheHandler):
 
     Used when FIRESTORE_PROJECT_ID env var is set (i.e. on Cloud Run).
     Falls back to CacheFileHandler locally.
+
+    spotipy reads the cached token before every API call, so a fresh token is
+    served from memory. Once it is within _STALE_SECONDS of expiry the document
+    is read again, so a refresh or logout done by another instance is picked up
+    before this one acts on a stale or rotated refresh_token.
     """
 
     def __init__(self, user_id: str):
-        from google.cloud import firestore
-        project_id = os.getenv("FIRESTORE_PROJECT_ID")
-        database_id = os.getenv("FIRESTORE_DATABASE_ID", "tolajs-timber")
-        self._doc = (
-            firestore.Client(project=project_id, database=database_id) if project_id
-            else firestore.Client(database=database_id)
-        ).collection("spotify_tokens").document(user_id)
+        self._doc = _get_firestore_client().collection("spotify_tokens").document(user_id)
+        self._token_info: Optional[dict] = None
 
     def get_cached_token(self) -> Optional[dict]:
+        token_info = self._token_info
+        if token_info is None or token_info.get("expires_at", 0) - time.time() <= _STALE_SECONDS:
+            return self.reload_cached_token()
+        return token_info
+
+    def reload_cached_token(self) -> Optional[dict]:
+        """Read the token from Firestore, bypassing the in-memory copy."""
         snapshot = self._doc.get()
-        return snapshot.to_dict() if snapshot.exists else None
+        self._token_info = snapshot.to_dict() if snapshot.exists else None
+        return self._token_info
 
     def save_token_to_cache(self, token_info: dict) -> None:
         self._doc.set(token_info)
+        self._token_info = token_info
 
     def delete(self) -> None:
         self._doc.delete()
+        self._token_info = None
+
+
+class _SingleFlightSpotifyOAuth(SpotifyOAuth):
+    """SpotifyOAuth whose token refresh runs at most once at a time.
+
+    spotipy refreshes on demand from whichever thread notices expiry, and the
+    background refresher may be doing the same. Callers that queue behind an
+    in-flight refresh reuse its result instead of hitting the token endpoint again.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._refresh_mutex = threading.Lock()
+
+    def refresh_access_token(self, refresh_token):
+        with self._refresh_mutex:
+            # Always consult the store first: another instance may already have
+            # refreshed (rotating the refresh_token) or the user may have logged out.
+            reload = getattr(self.cache_handler, "reload_cached_token", None)
+            token_info = reload() if reload else self.cache_handler.get_cached_token()
+            if reload and token_info is None:
+                raise SpotifyOauthError("No stored token for this user; they must log in again.")
+            if token_info and token_info.get("expires_at", 0) - time.time() > _STALE_SECONDS:
+                return token_info
+            if token_info and token_info.get("refresh_token"):
+                refresh_token = token_info["refresh_token"]
+            return super().refresh_access_token(refresh_token)
 
 
 def _cache_handler_for(user_id: str) -> CacheHandler:
@@ -169,10 +237,26 @@ class SpotifyOAuthHandler:
     """Reads Spotify credentials from env. Stateless — all per-user state
     lives in the module-level dicts above."""
 
+    SCOPES: FrozenSet[str] = frozenset({
+        "user-read-recently-played",
+        "user-read-playback-state",
+        "user-read-currently-playing",
+        "user-modify-playback-state",
+        "playlist-read-private",
+        "playlist-read-collaborative",
+        "playlist-modify-public",
+        "playlist-modify-private",
+        "user-library-read",
+        "user-library-modify",
+        "user-read-private",
+    })
+    # Built once; sorted so the string matches spotipy's own scope normalisation.
+    SCOPE: str = " ".join(sorted(SCOPES))
+
     def __init__(self, app_index: int = 0):
         self.client_id, self.client_secret = get_app_credentials(app_index)
-        self.redirect_uri = os.getenv("SPOTIFY_REDIRECT_URI", "http://localhost:8888/callback")
-        self.scope = self._get_required_scopes()
+        self.redirect_uri = _REDIRECT_URI
+        self.scope = self.SCOPE
 
         if not self.client_id or not self.client_secret:
             raise ValueError(
@@ -180,23 +264,8 @@ class SpotifyOAuthHandler:
                 "Please set SPOTIFY_CLIENT_ID/SPOTIFY_CLIENT_SECRET in your environment."
             )
 
-    def _get_required_scopes(self):
-        return " ".join([
-            "user-read-recently-played",
-            "user-read-playback-state",
-            "user-read-currently-playing",
-            "user-modify-playback-state",
-            "playlist-read-private",
-            "playlist-read-collaborative",
-            "playlist-modify-public",
-            "playlist-modify-private",
-            "user-library-read",
-            "user-library-modify",
-            "user-read-private",
-        ])
-
     def build_oauth(self, cache_handler: CacheHandler, show_dialog: bool = False) -> SpotifyOAuth:
-        return SpotifyOAuth(
+        return _SingleFlightSpotifyOAuth(
             client_id=self.client_id,
             client_secret=self.client_secret,
             redirect_uri=self.redirect_uri,
@@ -208,9 +277,17 @@ class SpotifyOAuthHandler:
 
     def revoke_token(self):
         """Legacy single-file revoke kept for backwards compatibility."""
-        cache = ".spotify_cache"
-        if os.path.exists(cache):
-            os.remove(cache)
+        Path(".spotify_cache").unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=None)
+def get_oauth_handler(app_index: int = 0) -> SpotifyOAuthHandler:
+    """Return the shared SpotifyOAuthHandler for an app index.
+
+    Handlers are stateless, so one instance per app is built lazily and reused
+    instead of re-validating credentials on every login and client lookup.
+    """
+    return SpotifyOAuthHandler(app_index=app_index)
 
 
 def get_spotify_client(user_id: str = None) -> Spotify:
@@ -235,16 +312,58 @@ def get_spotify_client(user_id: str = None) -> Spotify:
             "Attempting to load from cache — user may need to re-authenticate."
         )
         app_index = get_user_app_index(uid)
-        handler = SpotifyOAuthHandler(app_index=app_index)
+        handler = get_oauth_handler(app_index)
         cache_handler = _cache_handler_for(uid)
         if cache_handler.get_cached_token() is None:
             raise ValueError(f"No token cache found for user {uid}. User must log in first.")
         _user_oauth[uid] = handler.build_oauth(cache_handler)
         _user_clients[uid] = Spotify(auth_manager=_user_oauth[uid])
 
+    _ensure_fresh_token(uid)
     return _user_clients[uid]
 
 
+def _refresh_user_token(uid: str, oauth: SpotifyOAuth, refresh_token: str) -> None:
+    try:
+        oauth.refresh_access_token(refresh_token)
+    except Exception as e:
+        logger.warning(f"Token refresh failed for user {uid}: {e}")
+
+
+def _ensure_fresh_token(uid: str) -> None:
+    """Classify the user's cached token as fresh, stale or expired.
+
+    Fresh tokens are returned as-is. Stale tokens (expiring within _STALE_SECONDS)
+    get a background refresh — at most one pending per user — while the current
+    token keeps serving requests. Only an already-expired token blocks the caller.
+    The refreshed token is written back through the cache handler, so the cached
+    Spotify client picks it up without being rebuilt.
+    """
+    if _token_expiry.get(uid, 0) - time.time() > _STALE_SECONDS:
+        return
+
+    oauth = _user_oauth[uid]
+    token_info = oauth.cache_handler.get_cached_token()
+    if not token_info or not token_info.get("refresh_token"):
+        return
+
+    _token_expiry[uid] = token_info.get("expires_at", 0)
+    remaining = _token_expiry[uid] - time.time()
+    if remaining > _STALE_SECONDS:
+        return
+
+    with _refresh_lock:
+        future = _refresh_futures.get(uid)
+        if future is None or future.done():
+            future = _refresh_executor.submit(
+                _refresh_user_token, uid, oauth, token_info["refresh_token"]
+            )
+            _refresh_futures[uid] = future
+
+    if remaining <= 0:
+        future.result()
+
+
 def store_user_token(user_id: str, token_info: dict, app_index: int = 0) -> None:
     """Persist a freshly-obtained OAuth token and register the in-memory client.
 
@@ -253,9 +372,10 @@ def store_user_token(user_id: str, token_info: dict, app_index: int = 0) -> None
     cache_handler = _cache_handler_for(user_id)
     cache_handler.save_token_to_cache(token_info)
 
-    handler = SpotifyOAuthHandler(app_index=app_index)
+    handler = get_oauth_handler(app_index)
     _user_oauth[user_id] = handler.build_oauth(cache_handler)
     _user_clients[user_id] = Spotify(auth_manager=_user_oauth[user_id])
+    _token_expiry[user_id] = token_info.get("expires_at", 0)
     logger.info(f"Token stored and client registered for user {user_id} (app {app_index})")
 
 
@@ -267,3 +387,6 @@ def revoke_user_token(user_id: str) -> None:
 
     _user_oauth.pop(user_id, None)
     _user_clients.pop(user_id, None)
+    _token_expiry.pop(user_id, None)
+    with _refresh_lock:
+        _refresh_futures.pop(user_id, None)
@@ -4,9 +4,20 @@ import json
 import logging
 from typing import Optional
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
 _SESSIONS_COLLECTION = "chat_sessions"
+_MAX_BATCH_WRITES = 500  # Firestore's per-commit write limit
+
+
+def _loads_step_results(raw: str):
+    """Decode stored step_results, accepting the NaN/Infinity legacy json.dumps wrote."""
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return json.loads(raw)
 
 
 class HistoryRepository:
@@ -32,7 +43,7 @@ class HistoryRepository:
                     "response": turn["response"],
                     "success": turn["success"],
                     "timestamp": turn["timestamp"],
-                    "step_results": json.dumps(turn.get("step_results") or []),
+                    "step_results": turn.get("step_results_json") or orjson.dumps(turn.get("step_results") or []).decode(),
                 })
 
             self.db.collection(_SESSIONS_COLLECTION).document(session["session_id"]).set({
@@ -65,7 +76,8 @@ class HistoryRepository:
                     "response": t["response"],
                     "success": t["success"],
                     "timestamp": t["timestamp"],
-                    "step_results": json.loads(t["step_results"]) if t.get("step_results") else None,
+                    "step_results": _loads_step_results(t["step_results"]) if t.get("step_results") else None,
+                    "step_results_json": t.get("step_results") or None,
                 })
             return {
                 "session_id": data["session_id"],
@@ -82,18 +94,24 @@ class HistoryRepository:
         """Return the most recently active session ID for a user."""
         try:
             # Use a simple equality filter (no order_by) to avoid requiring a composite
-            # Firestore index. Sorting by last_active is done in Python instead.
+            # Firestore index. Picking the latest by last_active is done in Python instead.
+            # Only the two fields needed are fetched, not every session's turns.
             docs = (
                 self.db.collection(_SESSIONS_COLLECTION)
                 .where("user_id", "==", user_id)
+                .select(["session_id", "last_active"])
                 .stream()
             )
-            sessions = [doc.to_dict() for doc in docs]
-            sessions.sort(key=lambda s: s.get("last_active", 0), reverse=True)
-            for s in sessions:
-                if s.get("session_id") != exclude_session_id:
-                    return s.get("session_id")
-            return None
+            latest_id, latest_active = None, None
+            for doc in docs:
+                s = doc.to_dict()
+                session_id = s.get("session_id")
+                if session_id == exclude_session_id:
+                    continue
+                last_active = s.get("last_active", 0)
+                if latest_active is None or last_active > latest_active:
+                    latest_id, latest_active = session_id, last_active
+            return latest_id
         except Exception as e:
             logger.error("Failed to get latest session for user %s: %s", user_id, e)
             return None
@@ -112,13 +130,25 @@ class HistoryRepository:
     def delete_user_sessions(self, user_id: str):
         """Delete all chat sessions for a user."""
         try:
+            # Only the references are needed, so skip the session payloads, and
+            # delete through write batches instead of one round-trip per session.
             docs = (
                 self.db.collection(_SESSIONS_COLLECTION)
                 .where("user_id", "==", user_id)
+                .select([])
                 .stream()
             )
+            batch = self.db.batch()
+            pending = 0
             for doc in docs:
-                doc.reference.delete()
+                batch.delete(doc.reference)
+                pending += 1
+                if pending == _MAX_BATCH_WRITES:
+                    batch.commit()
+                    batch = self.db.batch()
+                    pending = 0
+            if pending:
+                batch.commit()
             logger.info("Deleted all Firestore sessions for user %s", user_id)
         except Exception as e:
             logger.error("Failed to delete sessions for user %s: %s", user_id, e)
@@ -9,6 +9,7 @@ class Turn(TypedDict):
     success: bool                   # from Orchestrator result
     timestamp: float                # time.time()
     step_results: Optional[List[Any]]  # orchestrator step results, forwarded as context to next turn
+    step_results_json: Optional[str]   # step_results serialised once, reused for context and persistence
 
 
 class Session(TypedDict):
@@ -5,20 +5,42 @@ bulk MERGE per table (load-job → MERGE → drop temp table), ensuring
 idempotent upserts and efficient batch writes.
 """
 
-import json
 import logging
 import os
 import time
 import uuid
 from datetime import date, datetime
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import lru_cache
 from io import BytesIO
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+import orjson
 from google.cloud import bigquery
 
 logger = logging.getLogger(__name__)
 
 DATASET_ID = "timber"
+DATASET_LOCATION = "US"
+
+
+def get_bigquery_client(project_id: str, location: Optional[str] = None) -> bigquery.Client:
+    """Return the process-wide BigQuery client for a project.
+
+    bigquery.Client is thread-safe; sharing one keeps its auth session and HTTP
+    connection pool warm across ingestion jobs, agent queries and parser lookups.
+    Jobs are created in ``location`` (the dataset's region, DATASET_LOCATION by
+    default) rather than leaving BigQuery to resolve it from the tables each
+    query references.
+    """
+    # Normalise before hitting the cache so every spelling of the same
+    # project/location shares one client.
+    return _bigquery_client(project_id, location or DATASET_LOCATION)
+
+
+@lru_cache(maxsize=None)
+def _bigquery_client(project_id: str, location: str) -> bigquery.Client:
+    return bigquery.Client(project=project_id, location=location)
 
 
 def _to_bq_timestamp(val) -> Optional[str]:
@@ -45,6 +67,28 @@ def _to_bq_date(val) -> Optional[str]:
     return str(val)
 
 
+def _user_id_param(user_id: str) -> bigquery.QueryJobConfig:
+    """Bind ``user_id`` as the @user_id query parameter."""
+    return bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("user_id", "STRING", user_id)]
+    )
+
+
+def _ts_prune_condition(rows: List[Dict]) -> str:
+    """Constant ts bounds for the events MERGE so BigQuery prunes partitions.
+
+    A matching target row shares the source row's event_id and therefore its ts,
+    so restricting T.ts to the batch's range never drops a match. Returns "" (no
+    pruning, full scan as before) if any timestamp fails to parse.
+    """
+    try:
+        stamps = [datetime.fromisoformat(r["ts"]) for r in rows]
+        lo, hi = min(stamps), max(stamps)  # TypeError on mixed naive/aware values
+    except (TypeError, ValueError):
+        return ""
+    return f" AND T.ts BETWEEN TIMESTAMP('{lo.isoformat()}') AND TIMESTAMP('{hi.isoformat()}')"
+
+
 class BigQueryDatabase:
     """BigQuery client with buffered batch ingestion.
 
@@ -52,8 +96,7 @@ class BigQueryDatabase:
         db = BigQueryDatabase(project_id="my-project")
         db.connect()
         db.ensure_tables()
-        for event in events:
-            db.ingest_listening_event(user, event)
+        db.ingest_listening_events(user, events)
         db.flush()   # writes everything to BigQuery
         db.close()
     """
@@ -112,14 +155,34 @@ class BigQueryDatabase:
         ],
     }
 
-    def __init__(self, project_id: str, dataset_id: str = DATASET_ID, location: str = "US"):
+    # Cluster each table on the columns its lookups and MERGE joins filter by, so
+    # those reads touch only the matching blocks instead of the whole table.
+    _CLUSTERING: Dict[str, List[str]] = {
+        "listening_events": ["user_id"],
+        "tracks": ["spotify_id", "track_id"],
+        "artists": ["artist_id"],
+        "track_artists": ["track_id"],
+        "albums": ["album_id"],
+        "track_albums": ["track_id"],
+        "artist_genres": ["artist_id"],
+        "album_artists": ["album_id"],
+    }
+
+    # Users known to have events, shared by every instance in the process. Only
+    # positive answers are cached: a user with no data may upload at any moment,
+    # but data only disappears via delete_user_data. Keyed on
+    # (project, dataset, user_id) so instances on other datasets don't collide.
+    _users_with_data: set = set()
+
+    def __init__(self, project_id: str, dataset_id: str = DATASET_ID, location: str = DATASET_LOCATION):
         self._project_id = project_id
         self._dataset_id = dataset_id
         self._location = location
         self._client: Optional[bigquery.Client] = None
 
         # Ingestion buffers — keyed dicts deduplicate in Python before the BQ MERGE
-        self._events: List[Dict] = []
+        self._events: Dict[str, Dict] = {}
+        self._duplicate_events = 0
         self._tracks: Dict[str, Dict] = {}
         self._artists: Dict[str, Dict] = {}
         self._albums: Dict[str, Dict] = {}
@@ -131,12 +194,12 @@ class BigQueryDatabase:
     # ── Lifecycle ───────────────────────────────────────────────────────────────
 
     def connect(self):
-        self._client = bigquery.Client(project=self._project_id)
+        self._client = get_bigquery_client(self._project_id, self._location)
         logger.info("BigQuery client initialised for %s.%s", self._project_id, self._dataset_id)
 
     def close(self):
-        if self._client:
-            self._client.close()
+        # The client is shared process-wide, so only drop our reference to it.
+        self._client = None
 
     def ensure_tables(self):
         """Create the dataset and all tables if they do not already exist."""
@@ -144,7 +207,29 @@ class BigQueryDatabase:
         dataset_ref.location = self._location
         self._client.create_dataset(dataset_ref, exists_ok=True)
 
-        for table_name, schema in self._SCHEMAS.items():
+        # One list call instead of a create_table round-trip per table; after the
+        # first run every table already exists and only clustering is reconciled.
+        existing = {t.table_id: t for t in self._client.list_tables(dataset_ref)}
+        missing = [name for name in self._SCHEMAS if name not in existing]
+
+        # Tables created before clustering was introduced keep their old layout
+        # until updated; BigQuery re-clusters new data from then on.
+        for table_name, listed in existing.items():
+            wanted = self._CLUSTERING.get(table_name)
+            if wanted is None or list(listed.clustering_fields or []) == wanted:
+                continue
+            table = self._client.get_table(self._client.dataset(self._dataset_id).table(table_name))
+            table.clustering_fields = wanted
+            self._client.update_table(table, ["clustering_fields"])
+            logger.info("Updated clustering on %s.%s.%s to %s",
+                        self._project_id, self._dataset_id, table_name, ", ".join(wanted))
+
+        if not missing:
+            logger.info("BigQuery tables already present in %s.%s", self._project_id, self._dataset_id)
+            return
+
+        for table_name in missing:
+            schema = self._SCHEMAS[table_name]
             table_ref = self._client.dataset(self._dataset_id).table(table_name)
             table = bigquery.Table(table_ref, schema=schema)
             if table_name == "listening_events":
@@ -152,15 +237,25 @@ class BigQueryDatabase:
                     type_=bigquery.TimePartitioningType.DAY,
                     field="ts",
                 )
-                table.clustering_fields = ["user_id"]
+            table.clustering_fields = self._CLUSTERING[table_name]
             self._client.create_table(table, exists_ok=True)
 
-        logger.info("BigQuery tables ensured in %s.%s", self._project_id, self._dataset_id)
+        logger.info("BigQuery tables ensured in %s.%s (created: %s)",
+                    self._project_id, self._dataset_id, ", ".join(missing))
 
     # ── Buffering ───────────────────────────────────────────────────────────────
 
     def ingest_listening_event(self, user: Dict[str, Any], event_data: Dict[str, Any]):
         """Buffer a single listening event. Call flush() when done to write to BigQuery."""
+        self.ingest_listening_events(user, (event_data,))
+
+    def ingest_listening_events(self, user: Dict[str, Any], events: Iterable[Dict[str, Any]]):
+        """Buffer a batch of listening events for one user. Call flush() when done."""
+        user_id = user["id"]
+        for event_data in events:
+            self._buffer_event(user_id, event_data)
+
+    def _buffer_event(self, user_id: str, event_data: Dict[str, Any]):
         if not event_data.get("track_name"):
             return
 
@@ -169,11 +264,13 @@ class BigQueryDatabase:
             return
 
         ms_played = event_data.get("ms_played", 0) or 0
-        event_id = f"{user['id']}_{event_data.get('trackId')}_{event_data.get('ts')}"
+        event_id = f"{user_id}_{event_data.get('trackId')}_{event_data.get('ts')}"
 
-        self._events.append({
+        if event_id in self._events:
+            self._duplicate_events += 1
+        self._events[event_id] = {
             "event_id": event_id,
-            "user_id": user["id"],
+            "user_id": user_id,
             "ts": _to_bq_timestamp(event_data.get("ts")),
             "track_id": track_id,
             "ms_played": ms_played,
@@ -182,7 +279,7 @@ class BigQueryDatabase:
             "is_full_listen": ms_played >= 30000,
             "skipped": event_data.get("skipped"),
             "incognito": event_data.get("incognito", False),
-        })
+        }
 
         if track_id not in self._tracks:
             self._tracks[track_id] = {
@@ -238,13 +335,24 @@ class BigQueryDatabase:
 
     def flush(self):
         """Write all buffered rows to BigQuery using temp-table MERGE (idempotent upserts)."""
+        self._write_tables(self._detach_buffers())
+
+    def flush_async(self, executor: Executor) -> Future:
+        """Detach the buffered rows and write them on ``executor``.
+
+        The buffers are emptied before this returns, so the caller can keep
+        ingesting the next batch while the MERGEs for this one run.
+        """
+        return executor.submit(self._write_tables, self._detach_buffers())
+
+    def _detach_buffers(self) -> List[Tuple]:
+        """Snapshot the buffers as per-table MERGE specs and reset them."""
         if not self._client:
             raise RuntimeError("Not connected to BigQuery.")
 
-        deduped_events = list({e["event_id"]: e for e in self._events}.values())
-        n_dupes = len(self._events) - len(deduped_events)
-        if n_dupes:
-            logger.info("[bq][flush] Deduplicated %d duplicate event(s) before MERGE.", n_dupes)
+        if self._duplicate_events:
+            logger.info("[bq][flush] Deduplicated %d duplicate event(s) before MERGE.",
+                        self._duplicate_events)
 
         tables = [
             # (name, schema, rows, key_cols, update_cols)
@@ -271,19 +379,12 @@ class BigQueryDatabase:
              ["album_id", "artist_id"], None),
             # listening_events last so dimensions exist before events reference them
             ("listening_events", self._SCHEMAS["listening_events"],
-             deduped_events, ["event_id"],
+             list(self._events.values()), ["event_id"],
              ["ms_played", "is_valid_listen", "is_full_listen", "skipped", "incognito"]),
         ]
 
-        t_flush = time.monotonic()
-        total_rows = 0
-        for name, schema, rows, key_cols, update_cols in tables:
-            if rows:
-                logger.info("[bq][flush] Merging %d rows → %s", len(rows), name)
-                self._merge_table(name, schema, rows, key_cols, update_cols)
-                total_rows += len(rows)
-
         self._events.clear()
+        self._duplicate_events = 0
         self._tracks.clear()
         self._artists.clear()
         self._albums.clear()
@@ -291,6 +392,26 @@ class BigQueryDatabase:
         self._track_albums.clear()
         self._artist_genres.clear()
         self._album_artists.clear()
+        return tables
+
+    def _write_tables(self, tables: List[Tuple]):
+        t_flush = time.monotonic()
+        pending = [t for t in tables if t[2]]
+        for name, _, rows, _, _ in pending:
+            logger.info("[bq][flush] Merging %d rows → %s", len(rows), name)
+
+        # Dimension MERGEs touch disjoint tables and are each a few seconds of
+        # job round-trips, so they run side by side; listening_events still goes
+        # last, once every dimension it references has landed.
+        dimensions = [t for t in pending if t[0] != "listening_events"]
+        events = [t for t in pending if t[0] == "listening_events"]
+        if dimensions:
+            with ThreadPoolExecutor(max_workers=len(dimensions)) as pool:
+                for future in [pool.submit(self._merge_table, *t) for t in dimensions]:
+                    future.result()
+        for t in events:
+            self._merge_table(*t)
+        total_rows = sum(len(t[2]) for t in pending)
 
         logger.info("[bq][flush] Complete. %d total rows written in %.1fs.",
                     total_rows, time.monotonic() - t_flush)
@@ -307,7 +428,13 @@ class BigQueryDatabase:
         temp_id = f"{self._project_id}.{self._dataset_id}.tmp_{table_name}_{uuid.uuid4().hex[:8]}"
         target = f"`{self._project_id}.{self._dataset_id}.{table_name}`"
 
-        ndjson = "\n".join(json.dumps(row, default=str) for row in rows).encode()
+        # Encode row by row into the buffer instead of joining one giant str and
+        # then copying it again with .encode() — halves peak memory on big flushes.
+        ndjson = BytesIO()
+        for row in rows:
+            ndjson.write(orjson.dumps(row, default=str))
+            ndjson.write(b"\n")
+        ndjson.seek(0)
         load_cfg = bigquery.LoadJobConfig(
             schema=schema,
             write_disposition="WRITE_TRUNCATE",
@@ -316,7 +443,7 @@ class BigQueryDatabase:
         try:
             t0 = time.monotonic()
             load_job = self._client.load_table_from_file(
-                BytesIO(ndjson), temp_id, job_config=load_cfg
+                ndjson, temp_id, job_config=load_cfg
             )
             load_job.result()
             logger.info("[bq][merge][%s] Load job complete (job_id=%s) in %.1fs.",
@@ -324,10 +451,15 @@ class BigQueryDatabase:
 
             col_names = [f.name for f in schema]
             key_cond = " AND ".join(f"T.{c} = S.{c}" for c in key_cols)
+            if table_name == "listening_events":
+                key_cond += _ts_prune_condition(rows)
             ins_cols = ", ".join(col_names)
             ins_vals = ", ".join(f"S.{c}" for c in col_names)
+            # Only rewrite rows whose values actually changed; re-ingesting an
+            # overlapping export otherwise rewrites every matched row for nothing.
             update_clause = (
-                f"WHEN MATCHED THEN UPDATE SET {', '.join(f'T.{c} = S.{c}' for c in update_cols)}"
+                f"WHEN MATCHED AND ({' OR '.join(f'T.{c} IS DISTINCT FROM S.{c}' for c in update_cols)}) "
+                f"THEN UPDATE SET {', '.join(f'T.{c} = S.{c}' for c in update_cols)}"
                 if update_cols
                 else ""
             )
@@ -353,30 +485,54 @@ class BigQueryDatabase:
 
     # ── Query / Admin ───────────────────────────────────────────────────────────
 
-    def execute_query(self, sql: str) -> List[Dict[str, Any]]:
-        """Run a read-only SQL query and return results as a list of dicts."""
+    def execute_query(self, sql: str, max_results: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Run a read-only SQL query and return results as a list of dicts.
+
+        With ``max_results`` only that many rows are downloaded; the rest of the
+        result set stays in BigQuery.
+        """
+        return self.execute_query_with_total(sql, max_results)[0]
+
+    def execute_query_with_total(
+        self, sql: str, max_results: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Like execute_query, but also return the full result set's row count.
+
+        The count comes from the query job itself, so callers can report how
+        much was cut off without downloading the rows past ``max_results``.
+        """
         if not self._client:
-            return []
-        job = self._client.query(sql)
-        return [dict(row) for row in job.result()]
+            return [], 0
+        rows = self._client.query_and_wait(sql, max_results=max_results)
+        data = [dict(row) for row in rows]
+        return data, rows.total_rows if rows.total_rows is not None else len(data)
 
     def user_has_data(self, user_id: str) -> bool:
         """Return True if the user has any listening events in BigQuery."""
-        safe = user_id.replace("'", "\\'")
-        sql = f"""
+        if (self._project_id, self._dataset_id, user_id) in self._users_with_data:
+            return True
+        if not self._client:
+            return False
+        rows = self._client.query_and_wait(
+            f"""
             SELECT COUNT(*) AS total
             FROM `{self._project_id}.{self._dataset_id}.listening_events`
-            WHERE user_id = '{safe}'
+            WHERE user_id = @user_id
             LIMIT 1
-        """
-        result = self.execute_query(sql)
-        return bool(result and result[0].get("total", 0) > 0)
+            """,
+            job_config=_user_id_param(user_id),
+        )
+        has_data = any(row.total > 0 for row in rows)
+        if has_data:
+            self._users_with_data.add((self._project_id, self._dataset_id, user_id))
+        return has_data
 
     def delete_user_data(self, user_id: str):
         """Delete all listening events for a user (dimension rows are shared, not deleted)."""
-        safe = user_id.replace("'", "\\'")
-        self._client.query(
+        self._users_with_data.discard((self._project_id, self._dataset_id, user_id))
+        self._client.query_and_wait(
             f"DELETE FROM `{self._project_id}.{self._dataset_id}.listening_events`"
-            f" WHERE user_id = '{safe}'"
-        ).result()
+            " WHERE user_id = @user_id",
+            job_config=_user_id_param(user_id),
+        )
         logger.info("Deleted listening events for user %s", user_id)
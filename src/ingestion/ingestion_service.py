@@ -2,6 +2,8 @@ import os
 import sys
 import time
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
 from typing import Callable, Optional
 
 import spotipy
@@ -16,6 +18,12 @@ if _ingestion_dir not in sys.path:
 from spotify_parser import SpotifyParser
 from bigquery_db import BigQueryDatabase
 
+# Every flush costs a load job + MERGE per table (~16 BigQuery jobs), so rows are
+# written in ~10k-event chunks rather than per 5k-event parser batch. With the
+# overlapped flush below up to ~2x this many events are held at once; lower it
+# via INGEST_FLUSH_EVERY_EVENTS on smaller containers.
+_FLUSH_EVERY_EVENTS = int(os.getenv("INGEST_FLUSH_EVERY_EVENTS", "10000"))
+
 
 def run_ingestion(
     temp_file_path: str,
@@ -59,20 +67,36 @@ def run_ingestion(
         db.ensure_tables()
 
         report(15, "Starting ingestion...")
-        parser = SpotifyParser(spotify_client)
+        parser = SpotifyParser(spotify_client, project_id, dataset_id)
         current_user = spotify_client.current_user()
 
         total = 0
         batch_num = 0
-        for batch in parser.parse_streaming_history_in_batches(temp_file_path):
-            batch_num += 1
-            for event in batch:
-                db.ingest_listening_event(current_user, event)
-            db.flush()
-            total += len(batch)
-            # Scale 15→90% — assumes ~100k events for a heavy user; saturates gracefully
-            pct = min(90, 15 + int(total * 75 / 100_000))
-            report(pct, f"Processed {total:,} events (batch {batch_num})...")
+        # Each batch's BigQuery write overlaps enrichment (API/BQ lookups) of the
+        # next one. The previous flush is awaited before another is detached, so
+        # at most one flush is in flight: peak memory is its detached rows plus
+        # their NDJSON serialisation, plus the buffer refilling behind it — i.e.
+        # under 2x _FLUSH_EVERY_EVENTS + one parser batch of events.
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="bq-flush") as flush_pool:
+            pending: Optional[Future] = None
+            buffered = 0
+            for batch in parser.parse_streaming_history_in_batches(temp_file_path):
+                batch_num += 1
+                db.ingest_listening_events(current_user, batch)
+                buffered += len(batch)
+                if buffered >= _FLUSH_EVERY_EVENTS:
+                    if pending is not None:
+                        pending.result()
+                    pending = db.flush_async(flush_pool)
+                    buffered = 0
+                total += len(batch)
+                # Scale 15→90% — assumes ~100k events for a heavy user; saturates gracefully
+                pct = min(90, 15 + int(total * 75 / 100_000))
+                report(pct, f"Processed {total:,} events (batch {batch_num})...")
+            if pending is not None:
+                pending.result()
+            if buffered:
+                db.flush()
 
         duration = round(time.time() - start_time, 1)
         report(100, f"Done! {total:,} events ingested in {duration}s.")
@@ -81,8 +105,9 @@ def run_ingestion(
     finally:
         db.close()
         try:
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-                logger.info("Removed temp file: %s", temp_file_path)
+            Path(temp_file_path).unlink()
+            logger.info("Removed temp file: %s", temp_file_path)
+        except FileNotFoundError:
+            pass
         except OSError as e:
             logger.warning("Could not remove temp file %s: %s", temp_file_path, e)
@@ -1,16 +1,18 @@
 """Lightweight ingestion for Spotify recently-played tracks.
 
 Transforms the Spotify recently-played API response into the same schema used
-by bigquery_db.ingest_listening_event so the data structure stays consistent.
+by bigquery_db.ingest_listening_events so the data structure stays consistent.
 """
 
 import logging
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any, Dict, List
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=8192)
 def _parse_release_date(release_date_str: str):
     if not release_date_str:
         return None
@@ -26,9 +28,11 @@ def _parse_release_date(release_date_str: str):
 
 
 def _transform_item(item: Dict[str, Any]) -> Dict[str, Any]:
-    """Converts one recently-played item to the ingest_listening_event schema."""
+    """Converts one recently-played item to the ingest_listening_events schema."""
     track = item["track"]
+    track_id = track["id"]
     album = track.get("album", {})
+    album_id = album.get("id")
 
     ts = datetime.fromisoformat(item["played_at"].replace("Z", "+00:00")).replace(microsecond=0)
 
@@ -38,9 +42,9 @@ def _transform_item(item: Dict[str, Any]) -> Dict[str, Any]:
 
     return {
         "ts": ts,
-        "trackId": track["id"],
+        "trackId": track_id,
         "track_name": track.get("name"),
-        "track_url": f"https://open.spotify.com/track/{track['id']}",
+        "track_url": f"https://open.spotify.com/track/{track_id}",
         "ms_played": duration_ms,
         "duration_ms": duration_ms,
         "skipped": False,
@@ -58,10 +62,10 @@ def _transform_item(item: Dict[str, Any]) -> Dict[str, Any]:
             }
             for a in track.get("artists", [])
         ],
-        "albumId": album.get("id"),
+        "albumId": album_id,
         "album_type": album.get("album_type"),
         "album_name": album.get("name"),
-        "album_url": f"https://open.spotify.com/album/{album['id']}" if album.get("id") else None,
+        "album_url": f"https://open.spotify.com/album/{album_id}" if album_id else None,
         "album_release_date": _parse_release_date(album.get("release_date", "")),
         "album_artists": [
             {
@@ -91,18 +95,19 @@ def ingest_recently_played(db, user_info: Dict[str, Any], items: List[Dict[str,
     user_id = user_info.get("id", "unknown")
     logger.info("[recently-played][user=%s] Ingesting %d items.", user_id, len(items))
 
-    count = 0
+    events = []
     skipped = 0
     for item in items:
         try:
-            event_data = _transform_item(item)
-            db.ingest_listening_event(user_info, event_data)
-            count += 1
+            events.append(_transform_item(item))
         except Exception as e:
             logger.warning("[recently-played][user=%s] Skipped item (played_at=%s): %s",
                            user_id, item.get("played_at"), e)
             skipped += 1
 
+    db.ingest_listening_events(user_info, events)
+    count = len(events)
+
     logger.info("[recently-played][user=%s] Buffered %d events (%d skipped). Flushing to BigQuery...",
                 user_id, count, skipped)
     db.flush()
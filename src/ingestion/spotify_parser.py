@@ -1,36 +1,202 @@
-import json
 import logging
 import os
 import re
 import time
+import orjson
 import spotipy
 from datetime import datetime, timezone
-from spotipy import SpotifyClientCredentials, SpotifyOAuth
-from typing import Dict, List, Any, Union, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Any, Union, Tuple, Optional
+
+if TYPE_CHECKING:
+    from spotipy import SpotifyClientCredentials, SpotifyOAuth
 
 logger = logging.getLogger(__name__)
 
+# Parallel Spotify multi-get requests per endpoint — enough to hide latency
+# without tripping the API's rate limiter on large first-time uploads.
+_API_CONCURRENCY = 4
+
+# Track ids per BigQuery lookup. The ids travel as one ARRAY parameter, which
+# counts toward the API request-size limit, and each lookup's result rows
+# (tracks x artists x albums) are held in memory at once; chunking bounds both
+# for very large libraries.
+_BQ_LOOKUP_CHUNK = 10_000
+
+# Below this size a history file is parsed whole with orjson rather than streamed.
+_ORJSON_MAX_BYTES = 32 * 1024 * 1024
+
+_TRACK_URI_PREFIX = "spotify:track:"
+_TRACK_ID_OFFSET = len(_TRACK_URI_PREFIX)
+_TRACK_URI_LEN = _TRACK_ID_OFFSET + 22
+_TRACK_URI_RE = re.compile(r"spotify:track:([a-zA-Z0-9]+)")
+
+
+# Album half of an event fragment for tracks whose album is unknown.
+_EMPTY_ALBUM_FIELDS: Dict[str, Any] = {
+    "albumId": None,
+    "album_type": None,
+    "album_name": None,
+    "album_url": None,
+    "album_release_date": None,
+    "album_artists": [],
+    "album_total_tracks": None,
+    "upc": None,
+}
+
+
+# ── Spotify API payload slimming ─────────────────────────────────────────────
+# Full API objects carry available_markets, images, album track listings etc.
+# Only the fields the enrichment reads are kept.
+
+def _slim_artist_ref(artist: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": artist.get("id"), "name": artist.get("name")}
+
+
+def _slim_album(album: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": album.get("id"),
+        "name": album.get("name"),
+        "album_type": album.get("album_type"),
+        "release_date": album.get("release_date"),
+        "total_tracks": album.get("total_tracks"),
+        "external_ids": album.get("external_ids") or {},
+        "artists": [_slim_artist_ref(a) for a in album.get("artists", [])],
+    }
+
+
+def _slim_track(track: Dict[str, Any]) -> Dict[str, Any]:
+    album = track.get("album")
+    return {
+        "id": track["id"],
+        "name": track.get("name"),
+        "duration_ms": track.get("duration_ms"),
+        "external_ids": track.get("external_ids") or {},
+        "album": _slim_album(album) if album else {},
+        "artists": [_slim_artist_ref(a) for a in track.get("artists", [])],
+    }
+
+
+def _slim_artist(artist: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": artist["id"], "genres": artist.get("genres", [])}
+
+
+def _iter_history_items(json_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the records of a streaming-history JSON array.
+
+    Files under _ORJSON_MAX_BYTES are parsed in one orjson call, which is several
+    times faster; larger ones are streamed with ijson so memory stays flat.
+    """
+    if os.path.getsize(json_path) < _ORJSON_MAX_BYTES:
+        with open(json_path, "rb") as f:
+            yield from orjson.loads(f.read())
+        return
+
+    import ijson
+    with open(json_path, "rb") as f:
+        yield from ijson.items(f, "item")
+
+
+def _iter_playback_records(json_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the history records that are track plays, with ``track_id`` set.
+
+    Records without a track URI or with no playtime (podcasts, zero-ms skips)
+    are dropped. ``track_id`` is None when the URI cannot be parsed.
+    """
+    for item in _iter_history_items(json_path):
+        uri = item.get("spotify_track_uri")
+        if uri is None or not item.get("ms_played"):
+            continue
+        item["track_id"] = _extract_track_id(uri)
+        yield item
+
+
+def _extract_track_id(uri: str) -> Optional[str]:
+    """Return the track id from a ``spotify:track:<id>`` URI, or None.
+
+    Well-formed URIs (always 36 chars: the prefix plus a 22-char base62 id) take
+    a length + prefix check and a fixed slice; anything else falls back to the
+    original regex so odd inputs resolve exactly as before.
+    """
+    if len(uri) == _TRACK_URI_LEN and uri.startswith(_TRACK_URI_PREFIX):
+        tid = uri[_TRACK_ID_OFFSET:]
+        if tid.isascii() and tid.isalnum():
+            return tid
+    match = _TRACK_URI_RE.search(uri)
+    return match.group(1) if match else None
+
+
+def _parse_event_ts(item: Dict[str, Any]) -> Any:
+    """Resolve an event's timestamp: offline_timestamp (ms) for offline plays, else ts.
+
+    Returns an aware datetime, the raw ts string if it cannot be parsed, or None.
+    """
+    if item.get("offline") is True:
+        offline_ms = item.get("offline_timestamp")
+        if offline_ms:
+            try:
+                return datetime.fromtimestamp(offline_ms / 1000, tz=timezone.utc)
+            except (ValueError, TypeError, OverflowError, OSError):
+                pass
+
+    ts = item.get("ts")
+    if not ts:
+        return None
+    try:
+        if ts[-1] == "Z":
+            ts = ts[:-1] + "+00:00"
+        return datetime.fromisoformat(ts)
+    except (ValueError, TypeError):
+        return item.get("ts")
+
+
+@lru_cache(maxsize=8192)
+def _parse_release_date(value: str) -> Any:
+    """Parse a Spotify release date of year, year-month or full-date precision.
+
+    Memoized: every play of an album re-parses the same string, and strptime is
+    slow. Returns a date, or the input unchanged if it does not parse.
+    """
+    try:
+        if len(value) == 4:
+            return datetime.strptime(value, "%Y").date()
+        if len(value) == 7:
+            return datetime.strptime(value, "%Y-%m").date()
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (ValueError, TypeError):
+        return value
+
 
 class SpotifyParser:
     def __init__(
         self,
-        sp: Union[spotipy.Spotify, SpotifyClientCredentials, SpotifyOAuth],
+        sp: spotipy.Spotify,
         project_id: str = None,
         dataset_id: str = None,
+        location: str = None,
     ):
-        if isinstance(sp, spotipy.Spotify):
-            self.sp = sp
-        else:
-            self.sp = spotipy.Spotify(auth_manager=sp)
-
+        self.sp = sp
         self._project_id = project_id or os.getenv("GCP_PROJECT_ID", "portfolio-projects-b1cf2")
         self._dataset_id = dataset_id or os.getenv("BQ_DATASET_ID", "timber")
+        self._location = location  # None -> bigquery_db.DATASET_LOCATION
         self._bq_client = None
 
+    @classmethod
+    def from_auth(
+        cls,
+        auth_manager: Union["SpotifyClientCredentials", "SpotifyOAuth"],
+        project_id: str = None,
+        dataset_id: str = None,
+        location: str = None,
+    ) -> "SpotifyParser":
+        """Build a parser from a spotipy auth manager instead of a client."""
+        return cls(spotipy.Spotify(auth_manager=auth_manager), project_id, dataset_id, location)
+
     def _get_bq_client(self):
         if self._bq_client is None:
-            from google.cloud import bigquery
-            self._bq_client = bigquery.Client(project=self._project_id)
+            from bigquery_db import get_bigquery_client
+            self._bq_client = get_bigquery_client(self._project_id, self._location)
         return self._bq_client
 
     def parse_streaming_history(self, json_path: str) -> List[Dict[str, Any]]:
@@ -45,31 +211,47 @@ class SpotifyParser:
         Yields lists of enriched event dicts, each at most ``batch_size`` long.
         A persistent track/artist/album cache is maintained across batches so
         metadata for a previously-seen track is never re-fetched.
-        """
-        import ijson
 
+        Every track id that survives the playback filters is looked up in
+        BigQuery once, up front, so batches only go to BigQuery for ids that
+        pre-pass could not see. This costs a second parse of the file, and the
+        caches keep every resolved track/artist/album (slimmed) for the life of
+        the generator — memory grows with the number of distinct tracks, not
+        events. Callers bound that by creating a fresh parser per group of files.
+        """
         track_cache: Dict[str, Any] = {}
         artist_cache: Dict[str, Any] = {}
         album_cache: Dict[str, Any] = {}
+        fragment_cache: Dict[str, Any] = {}
+        bq_checked: set = set()
+        unresolved: set = set()  # ids neither BigQuery nor the API could resolve
+
+        # Pre-pass: same filters as the batch loop, so skipped plays and podcasts
+        # never reach BigQuery; only the id set outlives the iteration.
+        all_ids_list = list({
+            item["track_id"] for item in _iter_playback_records(json_path) if item["track_id"]
+        })
+        for i in range(0, len(all_ids_list), _BQ_LOOKUP_CHUNK):
+            chunk = all_ids_list[i:i + _BQ_LOOKUP_CHUNK]
+            bq_tracks, bq_artists, bq_albums = self._fetch_from_bigquery(chunk)
+            track_cache.update(bq_tracks)
+            artist_cache.update(bq_artists)
+            album_cache.update(bq_albums)
+            bq_checked.update(chunk)
 
         batch: List[Dict[str, Any]] = []
 
-        with open(json_path, "rb") as f:
-            for item in ijson.items(f, "item"):
-                if not item.get("spotify_track_uri") or not item.get("ms_played"):
-                    continue
-                match = re.search(r"spotify:track:([a-zA-Z0-9]+)", item.get("spotify_track_uri", ""))
-                if not match:
-                    continue
-                item["track_id"] = match.group(1)
-                batch.append(item)
-
-                if len(batch) >= batch_size:
-                    yield self._enrich_batch(batch, track_cache, artist_cache, album_cache)
-                    batch = []
+        for item in _iter_playback_records(json_path):
+            if not item["track_id"]:
+                continue
+            batch.append(item)
+
+            if len(batch) >= batch_size:
+                yield self._enrich_batch(batch, track_cache, artist_cache, album_cache, fragment_cache, bq_checked, unresolved)
+                batch = []
 
         if batch:
-            yield self._enrich_batch(batch, track_cache, artist_cache, album_cache)
+            yield self._enrich_batch(batch, track_cache, artist_cache, album_cache, fragment_cache, bq_checked, unresolved)
 
     def _enrich_batch(
         self,
@@ -77,36 +259,55 @@ class SpotifyParser:
         track_cache: Dict[str, Any],
         artist_cache: Dict[str, Any],
         album_cache: Dict[str, Any],
+        fragment_cache: Dict[str, Any],
+        bq_checked: set,
+        unresolved: set,
     ) -> List[Dict[str, Any]]:
         """Enrich a single batch, updating the shared caches in place."""
         t0 = time.monotonic()
-        unique_new_ids = list({item["track_id"] for item in items if item["track_id"] not in track_cache})
+        unique_new_ids = list({
+            item["track_id"] for item in items
+            if item["track_id"] not in track_cache and item["track_id"] not in unresolved
+        })
         logger.info("[parser][batch] Enriching %d events. %d new track IDs (cache size: %d).",
                     len(items), len(unique_new_ids), len(track_cache))
 
         if unique_new_ids:
-            bq_tracks, bq_artists, bq_albums = self._fetch_from_bigquery(unique_new_ids)
-            track_cache.update(bq_tracks)
-            artist_cache.update(bq_artists)
-            album_cache.update(bq_albums)
+            bq_ids = [tid for tid in unique_new_ids if tid not in bq_checked]
+            if bq_ids:
+                bq_tracks, bq_artists, bq_albums = self._fetch_from_bigquery(bq_ids)
+                track_cache.update(bq_tracks)
+                artist_cache.update(bq_artists)
+                album_cache.update(bq_albums)
+                bq_checked.update(bq_ids)
 
             still_missing = [tid for tid in unique_new_ids if tid not in track_cache]
             if still_missing and self.sp:
-                api_tracks, api_artists, api_albums = self._fetch_from_api(still_missing)
+                api_tracks, api_artists, api_albums, failed_ids = self._fetch_from_api(
+                    still_missing, artist_cache, album_cache
+                )
                 track_cache.update(api_tracks)
                 artist_cache.update(api_artists)
                 album_cache.update(api_albums)
+                # Ids the API answered with null fall back directly in later batches
+                # instead of re-asking; ids whose request failed are retried next batch.
+                unresolved.update(
+                    tid for tid in still_missing if tid not in track_cache and tid not in failed_ids
+                )
 
         enriched = []
         fallback_count = 0
         for item in items:
             tid = item.get("track_id")
-            track = track_cache.get(tid)
-            if track:
+            fragment = fragment_cache.get(tid)
+            if fragment is None and tid in track_cache:
+                track = track_cache[tid]
                 album_id = track.get("album", {}).get("id")
-                enriched.append(
-                    self._transform_to_final_format(item, track, artist_cache, album_cache.get(album_id) if album_id else None)
+                fragment = fragment_cache[tid] = self._track_fragment(
+                    track, artist_cache, album_cache.get(album_id) if album_id else None
                 )
+            if fragment is not None:
+                enriched.append(self._transform_to_final_format(item, fragment))
             else:
                 enriched.append(self._create_fallback_item(item))
                 fallback_count += 1
@@ -116,20 +317,7 @@ class SpotifyParser:
         return enriched
 
     def _preprocess_streaming_data(self, json_path: str) -> List[Dict[str, Any]]:
-        with open(json_path, 'r', encoding='utf-8') as file:
-            json_data = json.load(file)
-
-        filtered_data = [
-            item for item in json_data
-            if item.get("spotify_track_uri") is not None
-            and item.get("ms_played") is not None
-            and item.get("ms_played") != 0
-        ]
-        for item in filtered_data:
-            track_uri = item.get("spotify_track_uri", "")
-            match = re.search(r'spotify:track:([a-zA-Z0-9]+)', track_uri)
-            item["track_id"] = match.group(1) if match else None
-        return filtered_data
+        return list(_iter_playback_records(json_path))
 
     def _enrich_with_data(self, filtered_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         valid_items = [item for item in filtered_data if item.get("track_id")]
@@ -146,22 +334,24 @@ class SpotifyParser:
         if missing_ids and self.sp:
             logger.info("[parser] %d/%d unique tracks not in BQ cache — fetching from Spotify API.",
                         len(missing_ids), len(unique_track_ids))
-            api_tracks, api_artists, api_albums = self._fetch_from_api(missing_ids)
+            api_tracks, api_artists, api_albums, _ = self._fetch_from_api(missing_ids, bq_artists, bq_albums)
             bq_tracks.update(api_tracks)
             bq_artists.update(api_artists)
             bq_albums.update(api_albums)
 
         # 3. Build enriched events
         enriched_data = []
+        fragments: Dict[str, Dict[str, Any]] = {}
         for item in valid_items:
             tid = item.get("track_id")
-            track = bq_tracks.get(tid)
-            if track:
+            fragment = fragments.get(tid)
+            if fragment is None and tid in bq_tracks:
+                track = bq_tracks[tid]
                 album_id = track.get("album", {}).get("id")
                 full_album = bq_albums.get(album_id) if album_id else None
-                enriched_data.append(
-                    self._transform_to_final_format(item, track, bq_artists, full_album)
-                )
+                fragment = fragments[tid] = self._track_fragment(track, bq_artists, full_album)
+            if fragment is not None:
+                enriched_data.append(self._transform_to_final_format(item, fragment))
             else:
                 enriched_data.append(self._create_fallback_item(item))
 
@@ -186,34 +376,37 @@ class SpotifyParser:
         t0 = time.monotonic()
 
         try:
+            from google.cloud import bigquery
+
             client = self._get_bq_client()
             ds = f"`{self._project_id}.{self._dataset_id}`"
-            ids_str = ", ".join(f"'{tid}'" for tid in track_ids)
 
-            # ── Query 1: tracks + their album ───────────────────────────────
-            track_rows = list(client.query(f"""
+            # Ids are bound as one ARRAY<STRING> parameter: the SQL text stays the
+            # same whatever the batch size and no quoting is needed.
+            def ids_param(ids) -> bigquery.QueryJobConfig:
+                return bigquery.QueryJobConfig(
+                    query_parameters=[bigquery.ArrayQueryParameter("ids", "STRING", list(ids))]
+                )
+
+            # ── Query 1: tracks + their album ids (details come from query 3) ─
+            track_rows = client.query_and_wait(f"""
                 SELECT
                     t.spotify_id  AS track_spotify_id,
                     t.track_id    AS bq_track_id,
                     t.track_name, t.duration_ms, t.isrc,
-                    alb.spotify_id                    AS album_spotify_id,
-                    alb.album_id                      AS bq_album_id,
-                    alb.album_name, alb.album_type,
-                    CAST(alb.release_date AS STRING)  AS release_date,
-                    alb.total_tracks, alb.upc
+                    alb.spotify_id AS album_spotify_id,
+                    alb.album_id   AS bq_album_id
                 FROM {ds}.tracks t
                 LEFT JOIN {ds}.track_albums tal ON t.track_id  = tal.track_id
                 LEFT JOIN {ds}.albums       alb ON tal.album_id = alb.album_id
-                WHERE t.spotify_id IN ({ids_str})
-            """).result())
-
-            if not track_rows:
-                return {}, {}, {}
+                WHERE t.spotify_id IN UNNEST(@ids)
+            """, job_config=ids_param(track_ids))
 
             tracks: Dict[str, Any] = {}
             bq_track_id_map: Dict[str, str] = {}  # bq_track_id -> spotify_track_id
             bq_album_ids: set = set()
 
+            # Consume the row iterator page by page rather than listing it first.
             for row in track_rows:
                 tid = row.track_spotify_id
                 if tid and tid not in tracks:
@@ -230,43 +423,41 @@ class SpotifyParser:
                 if row.bq_album_id:
                     bq_album_ids.add(row.bq_album_id)
 
-            # ── Query 2: track artists ───────────────────────────────────────
-            artist_ids: set = set()
+            if not tracks:
+                return {}, {}, {}
+
+            # Queries 2 and 3 both depend only on query 1, so they run concurrently.
+            def run(sql: str, ids) -> List[Any]:
+                return list(client.query_and_wait(sql, job_config=ids_param(ids)))
+
+            pool = ThreadPoolExecutor(max_workers=2)
+            artist_rows_future = album_rows_future = None
+
+            # ── Query 2: track artists + their genres ───────────────────────
             if bq_track_id_map:
-                bq_ids_str = ", ".join(f"'{k}'" for k in bq_track_id_map)
-                artist_rows = list(client.query(f"""
+                artist_rows_future = pool.submit(run, f"""
+                    WITH ta AS (
+                        SELECT track_id, artist_id
+                        FROM {ds}.track_artists
+                        WHERE track_id IN UNNEST(@ids)
+                    ),
+                    g AS (
+                        SELECT artist_id, ARRAY_AGG(genre) AS genres
+                        FROM {ds}.artist_genres
+                        WHERE artist_id IN (SELECT artist_id FROM ta)
+                        GROUP BY artist_id
+                    )
                     SELECT ta.track_id AS bq_track_id,
-                           a.artist_id, a.artist_name
-                    FROM {ds}.track_artists ta
+                           a.artist_id, a.artist_name,
+                           IFNULL(g.genres, []) AS genres
+                    FROM ta
                     JOIN {ds}.artists a ON ta.artist_id = a.artist_id
-                    WHERE ta.track_id IN ({bq_ids_str})
-                """).result())
+                    LEFT JOIN g ON g.artist_id = a.artist_id
+                """, bq_track_id_map)
 
-                for row in artist_rows:
-                    spotify_id = bq_track_id_map.get(row.bq_track_id)
-                    if spotify_id and spotify_id in tracks:
-                        tracks[spotify_id]["artists"].append(
-                            {"id": row.artist_id, "name": row.artist_name}
-                        )
-                        artist_ids.add(row.artist_id)
-
-            # ── Query 3: artist genres ───────────────────────────────────────
-            artists: Dict[str, List[str]] = {}
-            if artist_ids:
-                aid_str = ", ".join(f"'{a}'" for a in artist_ids)
-                genre_rows = list(client.query(f"""
-                    SELECT artist_id, genre
-                    FROM {ds}.artist_genres
-                    WHERE artist_id IN ({aid_str})
-                """).result())
-                for row in genre_rows:
-                    artists.setdefault(row.artist_id, []).append(row.genre)
-
-            # ── Query 4: albums + album artists ─────────────────────────────
-            albums: Dict[str, Any] = {}
+            # ── Query 3: albums + album artists ─────────────────────────────
             if bq_album_ids:
-                alb_ids_str = ", ".join(f"'{a}'" for a in bq_album_ids)
-                album_rows = list(client.query(f"""
+                album_rows_future = pool.submit(run, f"""
                     SELECT alb.spotify_id AS album_spotify_id,
                            alb.album_name, alb.album_type,
                            CAST(alb.release_date AS STRING) AS release_date,
@@ -275,10 +466,27 @@ class SpotifyParser:
                     FROM {ds}.albums alb
                     LEFT JOIN {ds}.album_artists aa ON alb.album_id = aa.album_id
                     LEFT JOIN {ds}.artists       a  ON aa.artist_id  = a.artist_id
-                    WHERE alb.album_id IN ({alb_ids_str})
-                """).result())
+                    WHERE alb.album_id IN UNNEST(@ids)
+                """, bq_album_ids)
+            pool.shutdown(wait=False)
+
+            # Every known artist gets an entry, [] when it has no genres, so callers
+            # can tell "no genres" apart from "unknown" and skip re-fetching it.
+            artists: Dict[str, List[str]] = {}
+            if artist_rows_future is not None:
+                for row in artist_rows_future.result():
+                    spotify_id = bq_track_id_map.get(row.bq_track_id)
+                    if spotify_id and spotify_id in tracks:
+                        tracks[spotify_id]["artists"].append(
+                            {"id": row.artist_id, "name": row.artist_name}
+                        )
+                        if row.artist_id not in artists:
+                            artists[row.artist_id] = list(row.genres)
 
-                for row in album_rows:
+            albums: Dict[str, Any] = {}
+            if album_rows_future is not None:
+                seen_album_artists: set = set()
+                for row in album_rows_future.result():
                     alb_id = row.album_spotify_id
                     if not alb_id:
                         continue
@@ -292,10 +500,11 @@ class SpotifyParser:
                             "external_ids": {"upc": row.upc},
                             "artists": [],
                         }
-                    if row.artist_id:
-                        existing = albums[alb_id]["artists"]
-                        if not any(a["id"] == row.artist_id for a in existing):
-                            existing.append({"id": row.artist_id, "name": row.artist_name})
+                    if row.artist_id and (alb_id, row.artist_id) not in seen_album_artists:
+                        seen_album_artists.add((alb_id, row.artist_id))
+                        albums[alb_id]["artists"].append(
+                            {"id": row.artist_id, "name": row.artist_name}
+                        )
 
             logger.info("[parser][bq] Lookup complete in %.1fs. tracks=%d artists=%d albums=%d",
                         time.monotonic() - t0, len(tracks), len(artists), len(albums))
@@ -309,9 +518,20 @@ class SpotifyParser:
     # ── Spotify API fallback ────────────────────────────────────────────────────
 
     def _fetch_from_api(
-        self, track_ids: List[str]
-    ) -> Tuple[Dict, Dict, Dict]:
-        """Fetch metadata for tracks not found in BigQuery."""
+        self,
+        track_ids: List[str],
+        known_artists: Optional[Dict[str, Any]] = None,
+        known_albums: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[Dict, Dict, Dict, set]:
+        """Fetch metadata for tracks not found in BigQuery.
+
+        Artists and albums already present in ``known_artists``/``known_albums``
+        are not re-fetched and are left out of the returned dicts. The fourth
+        value is the track ids whose request failed (rate limit, 5xx, ...), as
+        opposed to ids Spotify answered with null.
+        """
+        known_artists = known_artists or {}
+        known_albums = known_albums or {}
         logger.info("[parser][api] Fetching metadata for %d tracks from Spotify API.", len(track_ids))
         t0 = time.monotonic()
 
@@ -320,180 +540,176 @@ class SpotifyParser:
         albums: Dict[str, Any] = {}
 
         artist_ids_to_fetch: set = set()
-        fetched_tracks: List[Any] = []
 
         # Tracks (50 per call)
-        for i in range(0, len(track_ids), 50):
-            chunk = track_ids[i:i + 50]
-            try:
-                response = self.sp.tracks(chunk)
-                for track in response["tracks"]:
-                    if track:
-                        fetched_tracks.append(track)
-                        for artist in track.get("artists", []):
-                            artist_ids_to_fetch.add(artist["id"])
-            except Exception as e:
-                logger.warning("[parser][api] Error fetching tracks chunk %d-%d: %s", i, i + len(chunk), e)
-
-        logger.info("[parser][api] Fetched %d tracks. Now fetching albums...", len(fetched_tracks))
+        fetched_tracks, failed_track_ids = self._fetch_in_chunks(
+            self.sp.tracks, "tracks", track_ids, 50, _slim_track
+        )
+        for track in fetched_tracks:
+            for artist in track["artists"]:
+                artist_ids_to_fetch.add(artist["id"])
 
-        # Albums (20 per call)
+        # Albums (20 per call) and the tracks' artists (50 per call) only depend on
+        # the tracks, so both fetches run side by side.
         album_ids = {
             t["album"]["id"]
             for t in fetched_tracks
-            if t.get("album") and t["album"].get("id")
+            if t["album"].get("id") and t["album"]["id"] not in known_albums
         }
-        fetched_albums: Dict[str, Any] = {}
-        album_ids_list = list(album_ids)
-        for i in range(0, len(album_ids_list), 20):
-            chunk = album_ids_list[i:i + 20]
-            try:
-                response = self.sp.albums(chunk)
-                for album in response["albums"]:
-                    if album:
-                        fetched_albums[album["id"]] = album
-                        for artist in album.get("artists", []):
-                            artist_ids_to_fetch.add(artist["id"])
-            except Exception as e:
-                logger.warning("[parser][api] Error fetching albums chunk %d-%d: %s", i, i + len(chunk), e)
-
-        logger.info("[parser][api] Fetched %d albums. Now fetching %d artists/genres...",
-                    len(fetched_albums), len(artist_ids_to_fetch))
-
-        # Artists / genres (50 per call)
-        artist_ids_list = list(artist_ids_to_fetch)
-        for i in range(0, len(artist_ids_list), 50):
-            chunk = artist_ids_list[i:i + 50]
-            try:
-                response = self.sp.artists(chunk)
-                for artist in response["artists"]:
-                    if artist:
-                        artists[artist["id"]] = artist.get("genres", [])
-            except Exception as e:
-                logger.warning("[parser][api] Error fetching artists chunk %d-%d: %s", i, i + len(chunk), e)
+        artist_ids_to_fetch.difference_update(known_artists)
+        logger.info("[parser][api] Fetched %d tracks. Now fetching %d albums and %d artists/genres...",
+                    len(fetched_tracks), len(album_ids), len(artist_ids_to_fetch))
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            albums_future = pool.submit(
+                self._fetch_in_chunks, self.sp.albums, "albums", list(album_ids), 20, _slim_album
+            )
+            artists_future = pool.submit(
+                self._fetch_in_chunks, self.sp.artists, "artists", list(artist_ids_to_fetch), 50, _slim_artist
+            )
+            fetched_albums: Dict[str, Any] = {a["id"]: a for a in albums_future.result()[0]}
+            for artist in artists_future.result()[0]:
+                artists[artist["id"]] = artist["genres"]
+
+        # Album artists (usually already covered by the track artists)
+        album_artist_ids = {
+            artist["id"]
+            for album in fetched_albums.values()
+            for artist in album["artists"]
+        } - artist_ids_to_fetch - known_artists.keys()
+        for artist in self._fetch_in_chunks(
+            self.sp.artists, "artists", list(album_artist_ids), 50, _slim_artist
+        )[0]:
+            artists[artist["id"]] = artist["genres"]
 
         logger.info("[parser][api] API fetch complete in %.1fs. tracks=%d albums=%d artists=%d",
                     time.monotonic() - t0, len(fetched_tracks), len(fetched_albums), len(artists))
 
-        # Build track dicts in Spotify-API format
+        # Link tracks to their albums; a track's own simplified album stands in
+        # when the full album could not be fetched.
         for track in fetched_tracks:
-            tid = track["id"]
-            alb_simple = track.get("album", {})
-            alb_full = fetched_albums.get(alb_simple.get("id"), alb_simple)
-            tracks[tid] = {
-                "id": tid,
-                "name": track.get("name"),
-                "duration_ms": track.get("duration_ms"),
-                "external_ids": track.get("external_ids", {}),
-                "album": {"id": alb_full.get("id")},
-                "artists": [{"id": a.get("id"), "name": a.get("name")} for a in track.get("artists", [])],
-            }
-            alb_id = alb_full.get("id")
-            if alb_id and alb_id not in albums:
-                albums[alb_id] = {
-                    "id": alb_id,
-                    "name": alb_full.get("name"),
-                    "album_type": alb_full.get("album_type"),
-                    "release_date": alb_full.get("release_date"),
-                    "total_tracks": alb_full.get("total_tracks"),
-                    "external_ids": alb_full.get("external_ids", {}),
-                    "artists": [{"id": a.get("id"), "name": a.get("name")} for a in alb_full.get("artists", [])],
-                }
-
-        return tracks, artists, albums
+            alb_simple = track["album"]
+            alb_id = alb_simple.get("id")
+            tracks[track["id"]] = {**track, "album": {"id": alb_id}}
+            if alb_id and alb_id not in albums and alb_id not in known_albums:
+                albums[alb_id] = fetched_albums.get(alb_id, alb_simple)
+
+        return tracks, artists, albums, failed_track_ids
+
+    def _fetch_in_chunks(
+        self,
+        fetch: Callable[[List[str]], Dict],
+        key: str,
+        ids: List[str],
+        size: int,
+        slim: Callable[[Dict[str, Any]], Dict[str, Any]],
+    ) -> Tuple[List[Dict[str, Any]], set]:
+        """Call a Spotify multi-get endpoint over ``ids`` in chunks of ``size``.
+
+        Chunks are independent, so up to _API_CONCURRENCY requests run at once.
+        Each object is passed through ``slim`` as its chunk arrives, so the full
+        API payloads are dropped immediately. Returns the slimmed objects in input
+        order, plus the ids of any chunk whose request failed (logged and skipped).
+        """
+        failed: set = set()
+
+        def fetch_chunk(start: int) -> List[Dict[str, Any]]:
+            chunk = ids[start:start + size]
+            try:
+                return [slim(obj) for obj in fetch(chunk)[key] if obj]
+            except Exception as e:
+                logger.warning("[parser][api] Error fetching %s chunk %d-%d: %s",
+                               key, start, start + len(chunk), e)
+                failed.update(chunk)
+                return []
+
+        starts = range(0, len(ids), size)
+        if len(starts) <= 1:
+            results = [fetch_chunk(start) for start in starts]
+        else:
+            with ThreadPoolExecutor(max_workers=_API_CONCURRENCY) as pool:
+                results = list(pool.map(fetch_chunk, starts))
+        return [obj for objs in results for obj in objs], failed
 
     # ── Transform helpers ───────────────────────────────────────────────────────
 
-    def _transform_to_final_format(
+    def _track_fragment(
         self,
-        original_item: Dict[str, Any],
         track: Dict[str, Any],
         artist_cache: Dict[str, List[str]],
         full_album: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        album = full_album or {}
-        artists = track.get("artists", [])
-        album_artists = album.get("artists", [])
-
-        ts_parsed = None
-        if original_item.get("offline") is True and original_item.get("offline_timestamp"):
-            try:
-                ts_parsed = datetime.fromtimestamp(
-                    original_item["offline_timestamp"] / 1000, tz=timezone.utc
-                )
-            except (ValueError, TypeError, AttributeError):
-                ts_parsed = None
-
-        if ts_parsed is None and original_item.get("ts"):
-            try:
-                ts_parsed = datetime.fromisoformat(original_item["ts"].replace("Z", "+00:00"))
-            except (ValueError, AttributeError):
-                ts_parsed = original_item.get("ts")
+        """Build the per-track fields of an enriched event.
 
-        release_date_parsed = None
-        release_date_str = album.get("release_date")
-        if release_date_str:
-            try:
-                if len(release_date_str) == 4:
-                    release_date_parsed = datetime.strptime(release_date_str, "%Y").date()
-                elif len(release_date_str) == 7:
-                    release_date_parsed = datetime.strptime(release_date_str, "%Y-%m").date()
-                else:
-                    release_date_parsed = datetime.strptime(release_date_str, "%Y-%m-%d").date()
-            except (ValueError, AttributeError):
-                release_date_parsed = release_date_str
+        These are identical for every play of a track, so callers build them once
+        per track and reuse the result across its events. ``track``
+        and ``full_album`` are the dicts built by _fetch_from_bigquery /
+        _fetch_from_api, whose keys are always present, so they are subscripted.
+        """
+        track_id = track["id"]
+        if full_album:
+            album_id = full_album["id"]
+            release_date_str = full_album["release_date"]
+            album_fields = {
+                "albumId": album_id,
+                "album_type": full_album["album_type"],
+                "album_name": full_album["name"],
+                "album_url": f"http://open.spotify.com/album/{album_id}" if album_id else None,
+                "album_release_date": _parse_release_date(release_date_str) if release_date_str else None,
+                "album_artists": [{
+                    "id": a["id"],
+                    "name": a["name"],
+                    "url": f"http://open.spotify.com/artist/{a['id']}" if a["id"] else None,
+                } for a in full_album["artists"]],
+                "album_total_tracks": full_album["total_tracks"],
+                "upc": full_album["external_ids"].get("upc"),
+            }
+        else:
+            album_fields = _EMPTY_ALBUM_FIELDS
 
         return {
-            "ts": ts_parsed,
-            "trackId": track.get("id"),
-            "track_name": track.get("name"),
-            "track_url": f"http://open.spotify.com/track/{track.get('id')}" if track.get("id") else None,
-            "ms_played": original_item.get("ms_played"),
-            "duration_ms": track.get("duration_ms"),
-            "skipped": original_item.get("skipped"),
-            "incognito": original_item.get("incognito_mode", False),
-            "isrc": track.get("external_ids", {}).get("isrc"),
+            "trackId": track_id,
+            "track_name": track["name"],
+            "track_url": f"http://open.spotify.com/track/{track_id}" if track_id else None,
+            "duration_ms": track["duration_ms"],
+            "isrc": track["external_ids"].get("isrc"),
             "artists": [{
-                "id": a.get("id"),
-                "name": a.get("name"),
-                "url": f"http://open.spotify.com/artist/{a.get('id')}" if a.get("id") else None,
-                "genres": artist_cache.get(a.get("id"), []),
-            } for a in artists],
-            "albumId": album.get("id"),
-            "album_type": album.get("album_type"),
-            "album_name": album.get("name"),
-            "album_url": f"http://open.spotify.com/album/{album.get('id')}" if album.get("id") else None,
-            "album_release_date": release_date_parsed,
-            "album_artists": [{
-                "id": a.get("id"),
-                "name": a.get("name"),
-                "url": f"http://open.spotify.com/artist/{a.get('id')}" if a.get("id") else None,
-            } for a in album_artists],
-            "album_total_tracks": album.get("total_tracks"),
-            "upc": album.get("external_ids", {}).get("upc"),
+                "id": a["id"],
+                "name": a["name"],
+                "url": f"http://open.spotify.com/artist/{a['id']}" if a["id"] else None,
+                "genres": artist_cache.get(a["id"], []),
+            } for a in track["artists"]],
+            **album_fields,
         }
 
-    def _create_fallback_item(self, original_item: Dict[str, Any]) -> Dict[str, Any]:
-        ts_parsed = None
-        if original_item.get("offline") is True and original_item.get("offline_timestamp"):
-            try:
-                ts_parsed = datetime.fromtimestamp(
-                    original_item["offline_timestamp"] / 1000, tz=timezone.utc
-                )
-            except (ValueError, TypeError, AttributeError):
-                ts_parsed = None
+    def _transform_to_final_format(
+        self,
+        original_item: Dict[str, Any],
+        fragment: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Combine a play's own fields with its track's shared fragment.
 
-        if ts_parsed is None and original_item.get("ts"):
-            try:
-                ts_parsed = datetime.fromisoformat(original_item["ts"].replace("Z", "+00:00"))
-            except (ValueError, AttributeError):
-                ts_parsed = original_item.get("ts")
+        The fragment is shared by every play of the track (and _EMPTY_ALBUM_FIELDS
+        by every album-less one), so its list fields are copied per event.
+        """
+        event = dict(fragment)
+        event["artists"] = [dict(a) for a in fragment["artists"]]
+        event["album_artists"] = [dict(a) for a in fragment["album_artists"]]
+        event["ts"] = _parse_event_ts(original_item)
+        event["ms_played"] = original_item.get("ms_played")
+        event["skipped"] = original_item.get("skipped")
+        event["incognito"] = original_item.get("incognito_mode", False)
+        return event
+
+    def _create_fallback_item(self, original_item: Dict[str, Any]) -> Dict[str, Any]:
+        ts_parsed = _parse_event_ts(original_item)
+        track_id = original_item.get("track_id")
 
         return {
             "ts": ts_parsed,
-            "trackId": original_item.get("track_id"),
+            "trackId": track_id,
             "track_name": original_item.get("master_metadata_track_name"),
-            "track_url": f"http://open.spotify.com/track/{original_item.get('track_id')}" if original_item.get("track_id") else None,
+            "track_url": f"http://open.spotify.com/track/{track_id}" if track_id else None,
             "ms_played": original_item.get("ms_played"),
             "duration_ms": None,
             "skipped": False,
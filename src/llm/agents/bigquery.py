@@ -1,10 +1,12 @@
 """BigQuery Worker Agent for LangGraph."""
 
-import json
 import logging
 import os
 import sys
+import threading
 
+import orjson
+from google.api_core.exceptions import BadRequest, NotFound
 from langchain_core.tools import tool
 from langchain.agents import create_agent
 
@@ -15,9 +17,25 @@ from auth.oauth_handler import current_user_id as spotify_user_ctx
 logger = logging.getLogger(__name__)
 
 _WRITE_KEYWORDS = {"INSERT", "UPDATE", "DELETE", "DROP", "CREATE", "ALTER", "MERGE", "TRUNCATE"}
+_MAX_RESULT_ROWS = 50
+
+# One connected BigQueryDatabase for the process; the underlying client is
+# thread-safe and keeps its HTTP connection pool warm between tool calls.
+_db = None
+_db_lock = threading.Lock()
 
 
 def _get_bigquery_db():
+    global _db
+    if _db is not None:
+        return _db
+    with _db_lock:
+        if _db is None:
+            _db = _connect_bigquery_db()
+    return _db
+
+
+def _connect_bigquery_db():
     _ingestion_dir = os.path.abspath(
         os.path.join(os.path.dirname(__file__), "../../ingestion")
     )
@@ -48,44 +66,56 @@ def execute_sql(sql_query: str) -> str:
 
         user_id = spotify_user_ctx.get()
         if user_id and not db.user_has_data(user_id):
-            db.close()
             return (
                 "No listening history found for this user. They have not uploaded any Spotify Extended "
                 "Streaming History data yet. Let the user know they can upload their data using the "
                 "Upload History button in the sidebar."
             )
 
-        results = db.execute_query(sql_query)
-        db.close()
+        # One row past the cap is enough to know the result was truncated.
+        results, total_rows = db.execute_query_with_total(sql_query, max_results=_MAX_RESULT_ROWS + 1)
 
         if not results:
-            return json.dumps({
+            return orjson.dumps({
                 "data": [],
                 "note": (
                     "Query executed successfully but returned no results. "
                     "The requested data does not exist in the user's listening history. "
                     "Do not retry. Return this finding to the caller immediately."
                 ),
-            })
-
-        if len(results) > 50:
-            results = results[:50]
-            return json.dumps(
-                {"data": results, "note": "Results truncated to top 50 items."},
+            }).decode()
+
+        if len(results) > _MAX_RESULT_ROWS:
+            results = results[:_MAX_RESULT_ROWS]
+            return orjson.dumps(
+                {
+                    "data": results,
+                    "total_rows": total_rows,
+                    "note": f"Results truncated to top {_MAX_RESULT_ROWS} of {total_rows} rows.",
+                },
                 default=str,
-            )
+            ).decode()
 
-        return json.dumps({"data": results}, default=str)
+        # orjson serialises datetime/date natively; default=str covers Decimal and
+        # the other BigQuery scalar types.
+        return orjson.dumps({"data": results}, default=str).decode()
 
-    except Exception as e:
-        if db:
-            db.close()
+    except (BadRequest, NotFound) as e:
+        # Invalid SQL or an unknown table/column: rewriting the query can fix these.
         return (
             f"Database Error: {str(e)}. "
             "Analyze the error: if it is a syntax or schema issue (wrong table name, column name, "
             "missing JOIN condition, etc.), fix the SQL and retry. "
             "If the error suggests the data simply does not exist, do not retry — inform the user instead."
         )
+    except Exception as e:
+        # Auth, quota, network and server errors; no rewrite of the SQL will help.
+        logger.warning("[bq][tool] Non-retriable query failure: %s", e)
+        return (
+            f"Database Error: {str(e)}. "
+            "This is a service error, not a problem with the SQL. Do not retry; "
+            "tell the user their listening history is temporarily unavailable."
+        )
 
 
 # BigQuery Worker tools
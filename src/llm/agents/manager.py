@@ -14,6 +14,7 @@ from langgraph.graph import StateGraph, START, END
 from ..schemas.state_schemas import GlobalState
 from ..prompts.manager_prompts import MANAGER_SYSTEM_PROMPT
 from ..utils.config import get_gemini_llm
+from ..utils.text import extract_text
 
 # Import our worker builders
 from .spotify import build_spotify_worker
@@ -23,18 +24,6 @@ from .bigquery import build_bigquery_worker
 spotify_worker = build_spotify_worker()
 graph_worker = build_bigquery_worker()
 
-def _extract_text(content) -> str:
-    """Helper to extract raw text from Gemini's list format if needed."""
-    if isinstance(content, list):
-        text_parts = []
-        for block in content:
-            if isinstance(block, dict) and "text" in block:
-                text_parts.append(block["text"])
-            elif isinstance(block, str):
-                text_parts.append(block)
-        return "".join(text_parts)
-    return str(content)
-
 # 2. Define the Tools that the Manager uses to talk to the workers
 
 @tool
@@ -47,7 +36,7 @@ def ask_spotify_worker(query: str) -> str:
     # Invoke the compiled sub-graph
     result = spotify_worker.invoke({"messages": [HumanMessage(content=query)]})
     # The last message is the worker's final response
-    return _extract_text(result["messages"][-1].content)
+    return extract_text(result["messages"][-1].content)
 
 @tool
 def ask_bigquery_worker(query: str) -> str:
@@ -64,7 +53,7 @@ def ask_bigquery_worker(query: str) -> str:
     user_id = spotify_user_ctx.get() or "UNKNOWN"
     enriched_query = f"[Current date/time: {current_time}]\n[Active user_id: {user_id}]\n\n{query}"
     result = graph_worker.invoke({"messages": [HumanMessage(content=enriched_query)]})
-    return _extract_text(result["messages"][-1].content)
+    return extract_text(result["messages"][-1].content)
 
 @tool
 def google_search(query: str) -> str:
@@ -74,22 +63,11 @@ def google_search(query: str) -> str:
         query: The search query (e.g., 'Who won album of the year 2024').
     """
     # Use a secondary Gemini instance with native Search Grounding enabled
+    # (get_gemini_llm returns the same cached client on every call)
     search_llm = get_gemini_llm(model="gemini-3-flash-preview", temperature=0.0, enable_search=True)
     try:
         response = search_llm.invoke(f"Search the web and answer this concisely: {query}")
-        
-        # Handle list vs string content (Google GenAI sometimes returns list of dicts)
-        raw_content = response.content
-        if isinstance(raw_content, list):
-            text_parts = []
-            for block in raw_content:
-                if isinstance(block, dict) and "text" in block:
-                    text_parts.append(block["text"])
-                elif isinstance(block, str):
-                    text_parts.append(block)
-            return "".join(text_parts)
-            
-        return str(raw_content)
+        return extract_text(response.content)
     except Exception as e:
         return f"Web search failed: {e}"
 
@@ -1,6 +1,8 @@
 """Spotify Worker Agent for LangGraph."""
 
 import json
+from concurrent.futures import ThreadPoolExecutor
+
 from langchain_core.tools import tool
 from langchain.agents import create_agent
 
@@ -8,6 +10,11 @@ from langchain.agents import create_agent
 from ..prompts.spotify_prompts import SPOTIFY_WORKER_SYSTEM_PROMPT
 from ..utils.config import get_gemini_llm
 
+# Spotify search type -> key of its result page in the search response
+_SEARCH_RESULT_KEYS = {"track": "tracks", "artist": "artists", "album": "albums"}
+# Maximum URIs accepted by one playlist_add_items request
+_PLAYLIST_ADD_LIMIT = 100
+
 # We will dynamically import the spotify client to avoid circular/init issues
 def get_client():
     from auth.oauth_handler import get_spotify_client
@@ -46,14 +53,22 @@ def search_spotify(query: str, search_type: str = "track", limit: int = 5) -> st
                     "uri": item["uri"]
                 })
         elif search_type == "album":
-            for item in results.get("albums", {}).get("items", []):
-                artists = ", ".join([a["name"] for a in item["artists"]])
-                # Fetch full track listing for this album
+            items = results.get("albums", {}).get("items", [])
+
+            # Fetch full track listing for each album; the calls are independent,
+            # so they run side by side rather than one round-trip after another.
+            def fetch_track_names(album_id: str) -> list:
                 try:
-                    album_tracks = sp.album_tracks(item["id"], limit=50)
-                    track_names = [t["name"] for t in album_tracks.get("items", [])]
+                    album_tracks = sp.album_tracks(album_id, limit=50)
+                    return [t["name"] for t in album_tracks.get("items", [])]
                 except Exception:
-                    track_names = []
+                    return []
+
+            with ThreadPoolExecutor(max_workers=max(1, min(len(items), 5))) as pool:
+                track_listings = list(pool.map(fetch_track_names, [item["id"] for item in items]))
+
+            for item, track_names in zip(items, track_listings):
+                artists = ", ".join([a["name"] for a in item["artists"]])
                 formatted.append({
                     "name": item["name"],
                     "artists": artists,
@@ -63,7 +78,7 @@ def search_spotify(query: str, search_type: str = "track", limit: int = 5) -> st
                     "uri": item["uri"]
                 })
                 
-        return json.dumps(formatted, indent=2)
+        return json.dumps(formatted)
     except Exception as e:
         return f"Error searching Spotify: {str(e)}"
 
@@ -129,6 +144,9 @@ def start_playback(
         if not uri:
             if not search_type:
                 return "Error: provide either a uri or a search_type to start playback."
+            result_key = _SEARCH_RESULT_KEYS.get(search_type)
+            if result_key is None:
+                return f"Error: unsupported search_type '{search_type}'. Use 'track', 'album', or 'artist'."
 
             # Build Spotify field-filtered query
             query_parts = []
@@ -144,15 +162,7 @@ def start_playback(
                 return "Error: provide at least one of track, artist, or album to search."
 
             results = sp.search(q=query, type=search_type, limit=1)
-
-            if search_type == "track":
-                items = results.get("tracks", {}).get("items", [])
-            elif search_type == "artist":
-                items = results.get("artists", {}).get("items", [])
-            elif search_type == "album":
-                items = results.get("albums", {}).get("items", [])
-            else:
-                return f"Error: unsupported search_type '{search_type}'. Use 'track', 'album', or 'artist'."
+            items = results.get(result_key, {}).get("items", [])
 
             if not items:
                 return f"No {search_type} found for query: '{query}'."
@@ -221,11 +231,17 @@ def add_to_playlist(playlist_id: str, track_uris: list[str]) -> str:
         track_uris: A list of Spotify track URIs
     """
     sp = get_client()
+    added = 0
     try:
-        sp.playlist_add_items(playlist_id=playlist_id, items=track_uris)
-        return f"Successfully added {len(track_uris)} tracks to playlist."
+        # The endpoint takes at most 100 items per request. Chunks go out in order,
+        # one after another, so the tracks keep the order they were given in.
+        for start in range(0, len(track_uris), _PLAYLIST_ADD_LIMIT):
+            chunk = track_uris[start:start + _PLAYLIST_ADD_LIMIT]
+            sp.playlist_add_items(playlist_id=playlist_id, items=chunk)
+            added += len(chunk)
+        return f"Successfully added {added} tracks to playlist."
     except Exception as e:
-        return f"Error adding to playlist: {str(e)}"
+        return f"Error adding to playlist after {added} of {len(track_uris)} tracks were added: {str(e)}"
 
 @tool
 def get_recently_played(limit: int = 20) -> str:
@@ -255,7 +271,7 @@ def get_recently_played(limit: int = 20) -> str:
                 "played_at": item["played_at"],
                 "uri": track["uri"],
             })
-        return json.dumps(formatted, indent=2)
+        return json.dumps(formatted)
     except Exception as e:
         return f"Error fetching recently played: {str(e)}"
 
@@ -332,7 +348,7 @@ def get_current_playlists(limit: int = 20) -> str:
                 "total_tracks": playlist.get("tracks", {}).get("total"),
             })
 
-        return json.dumps(formatted, indent=2)
+        return json.dumps(formatted)
     except Exception as e:
         return f"Error fetching playlists: {str(e)}"
 
@@ -365,7 +381,7 @@ def get_playlist_tracks(playlist_id: str, limit: int = 50) -> str:
             for item in items
             if item.get("item")
         ]
-        return json.dumps(tracks, indent=2)
+        return json.dumps(tracks)
     except Exception as e:
         return f"Error fetching playlist tracks: {str(e)}"
 
@@ -1,15 +1,17 @@
 """LangGraph Orchestrator - A stateful bridge between FastAPI and the LangGraph Manager."""
 
-import json
 import logging
 import time
 import uuid
 from typing import Optional, Dict
 
+import orjson
+
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
 
 # Import the main LangGraph agent
 from .agents.manager import build_manager_agent
+from .utils.text import extract_text
 
 from chatbot.schemas import Turn, Session, ChatResponse
 from chatbot.history_db import HistoryRepository
@@ -28,6 +30,8 @@ class LangGraphOrchestrator:
     ):
         self._session_timeout = session_timeout or self.DEFAULT_TIMEOUT_SECONDS
         self._sessions: Dict[str, Session] = {}
+        # Spotify display names by user id; fetched once per user, not per turn.
+        self._display_names: Dict[str, Optional[str]] = {}
         
         # Build the LangGraph Manager Brain
         self.manager_app = build_manager_agent()
@@ -79,11 +83,16 @@ class LangGraphOrchestrator:
 
             # 2. Add tool results only for recent turns
             if include_tool_data and turn.get("step_results"):
-                context_str = json.dumps(turn["step_results"])
+                # Recent turns are re-sent on every chat call; reuse the string
+                # serialised when the turn was recorded instead of re-dumping it.
+                context_str = turn.get("step_results_json") or orjson.dumps(turn["step_results"]).decode()
                 messages.append(ToolMessage(
                     content=context_str,
                     name="previous_context",
-                    tool_call_id=f"ctx_{uuid.uuid4().hex[:8]}"
+                    # Derived from the turn rather than random, so replaying the same
+                    # history yields the same prompt prefix and Gemini's implicit
+                    # prompt cache can reuse it across turns.
+                    tool_call_id=f"ctx_{int(turn['timestamp'] * 1000)}"
                 ))
 
             # 3. Add what the AI said
@@ -115,15 +124,20 @@ class LangGraphOrchestrator:
         current_time = datetime.datetime.now(tz).strftime("%A, %B %d, %Y %I:%M %p %Z")
 
         # Fetch the user's display name from Spotify to personalise the context.
-        # Wrapped in try/except so a token hiccup never breaks the chat response.
+        # Wrapped in try/except so a token hiccup never breaks the chat response;
+        # only successful lookups are cached so a failure is retried next turn.
         display_name = None
         if user_id:
-            try:
-                from auth.oauth_handler import get_spotify_client
-                sp = get_spotify_client(user_id)
-                display_name = sp.current_user().get("display_name")
-            except Exception:
-                pass
+            if user_id in self._display_names:
+                display_name = self._display_names[user_id]
+            else:
+                try:
+                    from auth.oauth_handler import get_spotify_client
+                    sp = get_spotify_client(user_id)
+                    display_name = sp.current_user().get("display_name")
+                    self._display_names[user_id] = display_name
+                except Exception:
+                    pass
 
         user_line = f"- The current active user's name is: {display_name}." if display_name else ""
         system_context = (
@@ -150,19 +164,8 @@ class LangGraphOrchestrator:
             final_message = result_state["messages"][-1]
             
             # Handle list vs string content (Google GenAI sometimes returns list of dicts)
-            raw_content = final_message.content
-            if isinstance(raw_content, list):
-                # Extract text from the list of content blocks
-                text_parts = []
-                for block in raw_content:
-                    if isinstance(block, dict) and "text" in block:
-                        text_parts.append(block["text"])
-                    elif isinstance(block, str):
-                        text_parts.append(block)
-                response_text = "".join(text_parts)
-            else:
-                response_text = str(raw_content)
-                
+            response_text = extract_text(final_message.content)
+
             success = True
             
             # Extract tool data to save as 'step_results' for session context
@@ -174,7 +177,7 @@ class LangGraphOrchestrator:
                     try:
                         tool_outputs.append({
                             "tool": msg.name,
-                            "result": json.loads(msg.content) if msg.content.startswith('[') or msg.content.startswith('{') else msg.content
+                            "result": orjson.loads(msg.content) if msg.content.startswith(("[", "{")) else msg.content
                         })
                     except Exception:
                         tool_outputs.append({"tool": msg.name, "result": msg.content})
@@ -197,6 +200,7 @@ class LangGraphOrchestrator:
             success=success,
             timestamp=time.time(),
             step_results=tool_outputs,
+            step_results_json=orjson.dumps(tool_outputs).decode(),
         )
         session["turns"].append(turn)
         session["last_active"] = time.time()
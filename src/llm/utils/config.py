@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from langchain_google_genai import ChatGoogleGenerativeAI
 
 # Gemini config
@@ -10,9 +11,13 @@ BQ_PROJECT_ID = os.getenv("GCP_PROJECT_ID", "portfolio-projects-b1cf2")
 BQ_DATASET_ID = os.getenv("BQ_DATASET_ID", "timber")
 
 
+@lru_cache(maxsize=None)
 def get_gemini_llm(model: str = None, temperature: float = None, enable_search: bool = False) -> ChatGoogleGenerativeAI:
     """Get configured Google Gemini LLM instance.
 
+    Instances are cached per argument combination, so callers asking for the
+    same configuration share one client and its connection pool.
+
     Args:
         model: Override default model
         temperature: Override default temperature
@@ -0,0 +1,15 @@
+def extract_text(content) -> str:
+    """Return the raw text of a Gemini message's content.
+
+    Google GenAI sometimes returns a list of content blocks (dicts with a "text"
+    key, or plain strings) instead of a string; the text parts are joined.
+    """
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block if isinstance(block, str) else block["text"]
+            for block in content
+            if isinstance(block, str) or (isinstance(block, dict) and "text" in block)
+        )
+    return str(content)
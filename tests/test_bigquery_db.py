@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "ingestion"))
+
+try:
+    from google.cloud import bigquery  # noqa: F401
+    _HAS_BIGQUERY = True
+except ImportError:
+    _HAS_BIGQUERY = False
+
+
+@unittest.skipUnless(_HAS_BIGQUERY, "google-cloud-bigquery is not installed")
+class EnsureTablesTest(unittest.TestCase):
+    def _db(self, listed):
+        from bigquery_db import BigQueryDatabase
+
+        db = BigQueryDatabase("proj", "ds")
+        db._client = mock.MagicMock()
+        db._client.list_tables.return_value = listed
+        return db
+
+    def test_existing_tables_without_clustering_are_updated(self):
+        from bigquery_db import BigQueryDatabase
+
+        listed = [SimpleNamespace(table_id=name, clustering_fields=None)
+                  for name in BigQueryDatabase._SCHEMAS]
+        db = self._db(listed)
+
+        db.ensure_tables()
+
+        db._client.create_table.assert_not_called()
+        self.assertEqual(db._client.update_table.call_count, len(BigQueryDatabase._CLUSTERING))
+        for call in db._client.update_table.call_args_list:
+            self.assertEqual(call.args[1], ["clustering_fields"])
+
+    def test_existing_tables_with_clustering_are_left_alone(self):
+        from bigquery_db import BigQueryDatabase
+
+        listed = [SimpleNamespace(table_id=name, clustering_fields=BigQueryDatabase._CLUSTERING.get(name))
+                  for name in BigQueryDatabase._SCHEMAS]
+        db = self._db(listed)
+
+        db.ensure_tables()
+
+        db._client.create_table.assert_not_called()
+        db._client.get_table.assert_not_called()
+        db._client.update_table.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()